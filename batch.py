@@ -0,0 +1,173 @@
+"""
+Vectorised board features for many boards at once.
+
+Boards are stacked either into a boolean array of shape (boards, height,
+width), True where a locked block is, or as integer row bitmasks of shape
+(..., height) like BitBoard.rows. The features match Board.count_holes,
+Board.get_height and Board.count_wells, and the others features.scan.
+"""
+
+from typing import Sequence
+
+import numpy as np
+
+
+def stack_rows(row_masks: Sequence[Sequence[int]], width: int) -> np.ndarray:
+    """
+    Stack per-board row bitmasks into a boolean grid array.
+    """
+    rows = np.asarray(row_masks, dtype=np.int64)
+    return ((rows[..., None] >> np.arange(width)) & 1).astype(bool)
+
+
+def count_holes(grids: np.ndarray) -> np.ndarray:
+    """
+    Empty cells directly under a block on each board.
+    """
+    return (grids[:, :-1] & ~grids[:, 1:]).sum(axis=(1, 2))
+
+
+def get_height(grids: np.ndarray) -> np.ndarray:
+    """
+    Rows holding at least one block on each board.
+    """
+    return grids.any(axis=2).sum(axis=1)
+
+
+def count_wells(grids: np.ndarray) -> np.ndarray:
+    """
+    Empty cells from the fifth row down with a block below, two empty cells
+    above and blocks or walls either side of those two.
+    """
+    boards, height, width = grids.shape
+    # walls count as blocks to the side of the well
+    walled = np.ones((boards, height, width + 2), dtype=bool)
+    walled[:, :, 1:-1] = grids
+    floored = np.ones((boards, height + 1, width), dtype=bool)
+    floored[:, :-1] = grids
+
+    wells = (
+        ~grids[:, 4:]
+        & floored[:, 5:]
+        & ~grids[:, 3:-1]
+        & walled[:, 3:-1, :-2]
+        & walled[:, 3:-1, 2:]
+        & ~grids[:, 2:-2]
+        & walled[:, 2:-2, :-2]
+        & walled[:, 2:-2, 2:]
+    )
+    return wells.sum(axis=(1, 2))
+
+
+# Set bits in every 16 bit row mask
+POPCOUNT = np.array([bin(mask).count("1") for mask in range(1 << 16)], dtype=np.int64)
+
+
+def holes_from_rows(rows: np.ndarray, width: int) -> np.ndarray:
+    """
+    count_holes for boards given as row bitmasks of shape (..., height).
+    """
+    full = (1 << width) - 1
+    return POPCOUNT[rows[..., :-1] & ~rows[..., 1:] & full].sum(axis=-1)
+
+
+def height_from_rows(rows: np.ndarray) -> np.ndarray:
+    """
+    get_height for boards given as row bitmasks of shape (..., height).
+    """
+    return (rows != 0).sum(axis=-1)
+
+
+def wells_from_rows(rows: np.ndarray, width: int) -> np.ndarray:
+    """
+    count_wells for boards given as row bitmasks of shape (..., height).
+    """
+    full = (1 << width) - 1
+    # masks of columns whose left/right neighbour is filled or a wall
+    left_wall = 1
+    right_wall = 1 << (width - 1)
+    below = np.empty_like(rows[..., 4:])
+    below[..., :-1] = rows[..., 5:]
+    below[..., -1] = full
+    above = rows[..., 3:-1]
+    above2 = rows[..., 2:-2]
+    wells = (
+        ~rows[..., 4:]
+        & below
+        & ~above
+        & ((above << 1) | left_wall)
+        & ((above >> 1) | right_wall)
+        & ~above2
+        & ((above2 << 1) | left_wall)
+        & ((above2 >> 1) | right_wall)
+        & full
+    )
+    return POPCOUNT[wells].sum(axis=-1)
+
+
+def column_heights_from_rows(rows: np.ndarray, width: int) -> np.ndarray:
+    """
+    Height of the highest block in each column, of shape (..., width), for
+    boards given as row bitmasks of shape (..., height).
+    """
+    height = rows.shape[-1]
+    cells = (rows[..., None] >> np.arange(width)) & 1 == 1
+    return np.where(cells.any(axis=-2), height - cells.argmax(axis=-2), 0)
+
+
+def bumpiness_from_rows(rows: np.ndarray, width: int) -> np.ndarray:
+    """
+    Summed height differences of neighbouring columns, for boards given as
+    row bitmasks of shape (..., height).
+    """
+    heights = column_heights_from_rows(rows, width)
+    return np.abs(np.diff(heights, axis=-1)).sum(axis=-1)
+
+
+def row_transitions_from_rows(rows: np.ndarray, width: int) -> np.ndarray:
+    """
+    Filled cells next to empty ones along each row holding a block, the
+    walls counting as filled, for boards given as row bitmasks of shape
+    (..., height).
+    """
+    walled = (rows << 1) | 1 | (1 << (width + 1))
+    changes = (walled ^ (walled >> 1)) & ((1 << (width + 1)) - 1)
+    return np.where(rows != 0, POPCOUNT[changes], 0).sum(axis=-1)
+
+
+def column_transitions_from_rows(rows: np.ndarray, width: int) -> np.ndarray:
+    """
+    Filled cells above or below empty ones down each column, the floor
+    counting as filled, for boards given as row bitmasks of shape
+    (..., height).
+    """
+    full = (1 << width) - 1
+    above = np.zeros_like(rows)
+    above[..., 1:] = rows[..., :-1]
+    return POPCOUNT[rows ^ above].sum(axis=-1) + POPCOUNT[~rows[..., -1] & full]
+
+
+def evaluate(
+    weights: Sequence[float] | np.ndarray,
+    scores: np.ndarray,
+    holes: np.ndarray,
+    height: np.ndarray,
+    wells: np.ndarray,
+    defeated: np.ndarray,
+) -> np.ndarray:
+    """
+    TetrisClient's evaluation of boards from their features, higher being
+    better. weights is one set of four weights, or a population of them with
+    shape (solutions, 4), which scores every board under every solution and
+    adds a leading solutions axis to the result.
+    """
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim == 2:
+        weights = weights.reshape(len(weights), *[1] * np.ndim(scores), 4)
+    return (
+        ~defeated
+        * (scores * weights[..., 0])
+        / ((holes * weights[..., 1]) + 1)
+        / ((height * weights[..., 2]) + 1)
+        / (((np.maximum(wells, 1) - 1) * weights[..., 3]) + 1)
+    )
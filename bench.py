@@ -1,19 +1,190 @@
-from multiprocessing import Pool
-import random
-from main import Board
+"""
+Benchmarks for the board engines and the client.
+
+    python bench.py                       run every benchmark and print them
+    python bench.py -o results.json       also save the results
+    python bench.py -b baseline.json      flag regressions against saved results
+    python bench.py --scores              play full games and print the scores
+    python bench.py --scores --stats      ... with the stats of every game
+    python bench.py --scores -l s.jsonl   ... saving them, resuming if interrupted
+    python bench.py --profile PHASE       profile one phase of a capped game
+
+Microbenchmarks time single operations on boards from fixed seeded games.
+Macrobenchmarks play capped-length games and time them per piece placed.
+Every result is stored as seconds per operation, so lower is always better.
+"""
+
+import argparse
+import cProfile
+import json
+import platform
+import sys
+import time
+import timeit
+
+from bitboard import BitBoard
+from board import Board
 from client import TetrisClient
+import movegen
+import runner
+import stats
+
+ENGINES = {"board": Board, "bitboard": BitBoard}
 
 
-def test(index):
-    random.seed(index)
-    board = Board()
+def fixture(engine: str, seed: int = 0, pieces: int = 30):
+    """
+    A board part way through a seeded greedy game, so the stack has some
+    height, holes and wells to work on.
+    """
+    board = ENGINES[engine](seed=seed)
     client = TetrisClient(board)
-    while not board.defeated:
+    while not board.defeated and board.total_pieces < pieces:
         client.move()
-    print(index, board.score)
-    return board.score
+    return board
+
+
+def time_call(func, repeat: int = 5) -> float:
+    """
+    Best time of a call in seconds, over repeat runs of as many calls as fit
+    in about a fifth of a second.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def micro(engine: str) -> dict[str, float]:
+    """
+    Seconds per call of the operations the client spends its time in.
+    """
+    board = fixture(engine)
+    client = TetrisClient(board)
+    moved = board.copy()
+    rotated = board.copy()
+    return {
+        "copy": time_call(board.copy),
+        "input": time_call(lambda: moved.input(["LEFT", "RIGHT"], update=False)),
+        "rotate": time_call(lambda: rotated.rotate(1)),
+        "count_holes": time_call(board.count_holes),
+        "get_height": time_call(board.get_height),
+        "count_wells": time_call(board.count_wells),
+        "reset_features": time_call(board.copy().reset_features),
+        "find_permutations": time_call(lambda: client.find_permutations(board)),
+        "find_placements": time_call(lambda: movegen.find_placements(board)),
+        "calculate_move": time_call(client.calculate_move),
+    }
+
+
+def macro(engine: str, games: int = 4, max_pieces: int = 200) -> dict[str, float]:
+    """
+    Seconds per piece placed over seeded greedy games of at most max_pieces.
+    """
+    pieces = 0
+    start = time.perf_counter()
+    for seed in range(games):
+        board = ENGINES[engine](seed=seed)
+        client = TetrisClient(board)
+        while not board.defeated and board.total_pieces < max_pieces:
+            client.move()
+        pieces += board.total_pieces
+    return {"game_piece": (time.perf_counter() - start) / pieces}
+
+
+def run(engines=tuple(ENGINES)) -> dict:
+    results = {}
+    for engine in engines:
+        for name, seconds in {**micro(engine), **macro(engine)}.items():
+            results[f"{engine}.{name}"] = seconds
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list[str]:
+    """
+    Names of the benchmarks more than threshold slower than in baseline.
+    """
+    return [
+        name
+        for name, seconds in current["results"].items()
+        if name in baseline["results"]
+        and seconds > baseline["results"][name] * (1 + threshold)
+    ]
+
+
+def report(current: dict, baseline: dict | None = None):
+    for name, seconds in current["results"].items():
+        line = f"{name:30} {seconds * 1e6:12.2f} us"
+        if baseline and name in baseline["results"]:
+            change = seconds / baseline["results"][name] - 1
+            line += f" {change:+8.1%}"
+        if name.endswith(".game_piece"):
+            line += f"  ({1 / seconds:.0f} pieces/s)"
+        print(line)
 
 
 if __name__ == "__main__":
-    with Pool(8) as pool:
-        pool.map(test, range(16))
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("-o", "--output", help="save the results to this JSON file")
+    parser.add_argument("-b", "--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="fraction slower than the baseline counted as a regression",
+    )
+    parser.add_argument(
+        "-e", "--engine", choices=ENGINES, action="append", help="engines to run"
+    )
+    parser.add_argument(
+        "--scores", action="store_true", help="play full games and print the scores"
+    )
+    parser.add_argument(
+        "--stats", action="store_true", help="print the stats of every --scores game"
+    )
+    parser.add_argument(
+        "--seeds", type=int, default=16, help="seeds played by --scores"
+    )
+    parser.add_argument(
+        "-l", "--log", help="JSONL file for the --scores games, resumed if present"
+    )
+    parser.add_argument(
+        "--profile", choices=stats.PHASES, help="profile one phase of a capped game"
+    )
+    args = parser.parse_args()
+
+    if args.scores:
+        jobs = [(None, seed) for seed in range(args.seeds)]
+        for result in runner.run(jobs, path=args.log, show_stats=args.stats):
+            print(result["seed"], result["score"])
+            if args.stats:
+                print(json.dumps({"game": result["seed"], **result["stats"]}))
+        sys.exit()
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        stats.enable(hooks={args.profile: stats.profiler_hook(profiler)})
+        macro(args.engine[0] if args.engine else "bitboard", games=1)
+        stats.disable()
+        print(json.dumps(stats.STATS.as_dict(), indent=2))
+        profiler.print_stats("cumulative")
+        sys.exit()
+
+    current = run(args.engine or tuple(ENGINES))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    report(current, baseline)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=2)
+    if baseline:
+        regressions = compare(baseline, current, args.threshold)
+        for name in regressions:
+            print(f"Regression: {name}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,538 @@
+from typing import Mapping, Sequence
+
+from pieces import PIECES, SPAWN_OFFSETS, PieceSequence, Placement, piece_table
+from rules import PlaceEvent, line_clear_score
+from zobrist import zobrist_table
+
+
+class BitBoard:
+    """
+    Headless tetris board storing each row as an integer bitmask.
+
+    Bit ``c`` of ``self.rows[r]`` is set when the cell at row ``r``, column
+    ``c`` holds a locked block. The active piece is kept in ``self.active``
+    as a (placement, row) pair from the piece table and is only written into
+    the rows when it locks. Input, spawning and scoring follow main.Board.
+    """
+
+    def __init__(
+        self,
+        width: int = 10,
+        height: int = 20,
+        rows: Sequence[int] | None = None,
+        colours: bool = False,
+        seed: int | None = None,
+        mode: str = "uniform",
+        sequence: PieceSequence | None = None,
+    ):
+        self.pieces = PIECES
+        # Pieces are dealt from a sequence of the board's own, or a shared one
+        # when given, with drawn counting the pieces taken from it so far
+        self.sequence = sequence if sequence is not None else PieceSequence(seed, mode)
+        self.drawn = 0
+        self.table = piece_table(width)
+        self.width = width
+        self.height = height
+        self.full_mask = (1 << width) - 1
+        self.rows: list[int]
+        if rows:
+            self.rows = list(rows)
+        else:
+            self.rows = [0] * self.height
+        # Optional colour plane, only kept up to date when rendering is wanted
+        self.colours: list[list[str | None]] | None = None
+        if colours:
+            self.colours = [[None] * self.width for _ in range(self.height)]
+        # Board features, kept up to date as pieces lock and lines clear
+        self.heights: list[int] = [0] * self.width
+        self.filled_rows = 0
+        self.holes = 0
+        self.wells = 0
+        # Rows under the last piece locked, and its cells in the lines it
+        # completed times the number of those lines
+        self.landing_height = 0
+        self.eroded_cells = 0
+        # Zobrist hash of the locked cells
+        self.zobrist = zobrist_table(height, width)
+        self.hash = 0
+        self.reset_features()
+        self.active: tuple[Placement, int] | None = None
+        self.saved_piece: Mapping | None = None
+        self.score: int = 0
+        self.difficult_combo = 0
+        self.total_pieces = 0
+        self.hold_used = False
+        self.defeated = False
+        # replay.Recorder logging this board's placements, if any
+        self.recorder = None
+        self.pick_next_piece()
+        self.update()
+
+    def update(self, tick=False):
+        self.clear_lines()
+
+        if not self.active:
+            self.spawn(self.next_piece)
+            self.total_pieces += 1
+            self.pick_next_piece()
+            self.hold_used = False
+
+        if tick and self.active:
+            self.input("GRAVITY")
+
+    def clear_lines(self) -> tuple[int, bool]:
+        """
+        Clear full rows and score them.
+        Returns the number of lines cleared and whether it was a perfect clear.
+        """
+        full = self.full_mask
+        if full not in self.rows:
+            return 0, False
+        kept = [i for i, row in enumerate(self.rows) if row != full]
+        cleared_lines = self.height - len(kept)
+        self.rows = [0] * cleared_lines + [self.rows[i] for i in kept]
+        self.reset_features()
+        if self.colours is not None:
+            self.colours = [[None] * self.width for _ in range(cleared_lines)] + [
+                self.colours[i] for i in kept
+            ]
+
+        # increase the combo if a tetris is scored
+        if cleared_lines == 4:
+            self.difficult_combo += 1
+        else:
+            self.difficult_combo = 0
+        perfect_clear = not self.rows[-1]
+        self.score += line_clear_score(
+            cleared_lines, self.difficult_combo, perfect_clear
+        )
+        return cleared_lines, perfect_clear
+
+    def input(self, key: str | Sequence[str], update: bool = True):
+        # If only one key was given, convert to list
+        keys = [key] if type(key) is not list else key
+
+        successes = []
+
+        for key in keys:
+            horiz = 0
+            verti = 0
+            rot = 0
+            if key == "RIGHT":
+                horiz += 1
+            elif key == "LEFT":
+                horiz -= 1
+            elif key == "GRAVITY":
+                verti += 1
+            elif key == "HARDDROP":
+                if self.active:
+                    self.hard_drop()
+            elif key == "ROT_CLOCKWISE":
+                rot -= 1
+            elif key == "ROT_ANTICLOCKWISE":
+                rot += 1
+            elif key == "HOLD" and self.active and not self.hold_used:
+                self.hold()
+
+            if self.active:
+                # Rotate the piece if we need to
+                if rot:
+                    self.rotate(rot)
+                placement, row = self.active
+                if horiz:
+                    columns = self.table[placement.name][placement.orientation]
+                    column = placement.column + horiz
+                    placement = columns[column] if 0 <= column < len(columns) else None
+                if placement and self.fits(placement, row + verti):
+                    self.active = (placement, row + verti)
+                    successes.append(True)
+                else:
+                    if key == "GRAVITY":
+                        self.lock()
+                    successes.append(False)
+            else:
+                successes.append(key == "HARDDROP")
+
+        if update:
+            self.update(tick=False)
+        return successes
+
+    def fits(self, placement: Placement, row: int) -> bool:
+        """
+        Whether the placement with the top of its bounding box at row is
+        inside the board and clear of locked blocks.
+        """
+        if row < 0 or row + placement.height > self.height:
+            return False
+        rows = self.rows
+        for offset, mask in enumerate(placement.masks):
+            if rows[row + offset] & mask:
+                return False
+        return True
+
+    def hard_drop(self):
+        """
+        Drop the active piece as far as it will go and lock it, scoring 2
+        points per attempted row like main.Board does.
+        """
+        placement, row = self.active
+        start = row
+        while self.fits(placement, row + 1):
+            row += 1
+        self.active = (placement, row)
+        self.score += 2 * (row - start + 1)
+        self.lock()
+
+    def place(
+        self, piece: str, orientation: int, column: int, row: int | None = None
+    ) -> PlaceEvent:
+        """
+        Drop the named piece straight down in the given orientation with the
+        left of its bounding box at column, lock it and spawn the next piece.
+
+        The piece may be the current piece or, if hold is available, the one
+        HOLD would swap in. Scoring matches a hard drop from the active
+        piece's row followed by update(). Giving row locks the top of the
+        piece there instead, for replaying pieces slid under an overhang.
+        Everything is checked before the HOLD, so a place() that raises
+        leaves the board as it was.
+        """
+        if not self.active:
+            raise ValueError("There is no active piece to place")
+        holding = piece != self.current_piece["name"]
+        if holding:
+            held = self.saved_piece or self.next_piece
+            if self.hold_used or piece != held["name"]:
+                raise ValueError(f"Piece {piece} is not available to place")
+            if not self.spawn_fits(held):
+                # the HOLD itself tops out, wherever the piece was to go
+                self.hold()
+                return PlaceEvent(0, 0, False)
+
+        orientations = self.table[piece]
+        if not 0 <= orientation < len(orientations):
+            raise ValueError(f"Piece {piece} has no orientation {orientation}")
+        columns = orientations[orientation]
+        if not 0 <= column < len(columns):
+            raise ValueError(f"Piece {piece} does not fit at column {column}")
+        placement = columns[column]
+
+        # a held piece starts from where it spawns
+        start = SPAWN_OFFSETS[piece][0] if holding else self.active[1]
+        if row is None:
+            row = self.landing_row(placement)
+            if row < start:
+                raise ValueError(f"Piece {piece} is blocked at column {column}")
+        elif not self.fits(placement, row):
+            raise ValueError(f"Piece {piece} does not fit at row {row}")
+
+        if holding:
+            self.hold()
+        score = self.score
+        self.active = (placement, row)
+        self.score += 2 * (row - start + 1)
+        self.lock()
+        cleared_lines, perfect_clear = self.clear_lines()
+        self.update()
+        return PlaceEvent(cleared_lines, self.score - score, perfect_clear)
+
+    def landing_row(self, placement: Placement) -> int:
+        """
+        Row the top of the placement lands on when dropped from above the
+        stack, worked out from the column heights.
+        """
+        heights = self.heights
+        return (
+            min(
+                self.height - heights[placement.column + col] - bottom
+                for col, bottom in enumerate(placement.bottom)
+            )
+            - 1
+        )
+
+    def column_heights(self) -> list[int]:
+        """
+        Height of the highest locked block in each column.
+        """
+        return self.heights[:]
+
+    def reset_features(self):
+        """
+        Recount the column heights, filled rows, holes, wells and hash from
+        scratch.
+        """
+        heights = [0] * self.width
+        remaining = self.full_mask
+        for rowindex, row in enumerate(self.rows):
+            found = row & remaining
+            while found:
+                col = (found & -found).bit_length() - 1
+                heights[col] = self.height - rowindex
+                found &= found - 1
+            remaining &= ~row
+            if not remaining:
+                break
+        self.heights = heights
+        self.filled_rows = self.height - self.rows.count(0)
+        self.holes = self.holes_between(0, self.height)
+        self.wells = self.wells_between(0, self.height)
+        self.hash = 0
+        for rowindex, row in enumerate(self.rows):
+            keys = self.zobrist[rowindex]
+            while row:
+                self.hash ^= keys[(row & -row).bit_length() - 1]
+                row &= row - 1
+
+    def lock(self):
+        """
+        Write the active piece into the row bitmasks and update the board
+        features and hash.
+        """
+        placement, row = self.active
+        if self.recorder is not None:
+            self.recorder.lock(
+                placement.name,
+                placement.orientation,
+                placement.column,
+                row,
+                self.hold_used,
+            )
+        rows = self.rows
+        # only rows next to the piece can change their hole and well counts
+        first = row - 1
+        stop = row + placement.height + 2
+        holes = self.holes_between(first, stop)
+        wells = self.wells_between(first, stop)
+        for offset, mask in enumerate(placement.masks):
+            if not rows[row + offset]:
+                self.filled_rows += 1
+            rows[row + offset] |= mask
+        full = self.full_mask
+        completed = [
+            mask
+            for offset, mask in enumerate(placement.masks)
+            if rows[row + offset] == full
+        ]
+        self.landing_height = self.height - row - placement.height
+        self.eroded_cells = len(completed) * sum(mask.bit_count() for mask in completed)
+        self.holes += self.holes_between(first, stop) - holes
+        self.wells += self.wells_between(first, stop) - wells
+        heights = self.heights
+        for rowoffset, col in placement.cells:
+            self.hash ^= self.zobrist[row + rowoffset][col]
+            if self.height - row - rowoffset > heights[col]:
+                heights[col] = self.height - row - rowoffset
+        if self.colours is not None:
+            for rowoffset, col in placement.cells:
+                self.colours[row + rowoffset][col] = self.current_piece["colour"]
+        self.active = None
+
+    def hold(self):
+        self.hold_used = True
+        old_piece = self.current_piece
+
+        if self.saved_piece:
+            self.spawn(self.saved_piece)
+        else:
+            self.spawn(self.next_piece)
+            self.total_pieces += 1
+            self.pick_next_piece()
+
+        self.saved_piece = old_piece
+
+    def rotate(self, rotation):
+        if not self.active:
+            return
+
+        # convert negative rotations into positive
+        rotation %= 4
+
+        for _ in range(rotation):
+            # each turn is anticlockwise about the top left of the bounding box
+            placement, row = self.active
+            orientations = self.table[placement.name]
+            columns = orientations[(placement.orientation + 1) % len(orientations)]
+            if placement.column < len(columns):
+                rotated = columns[placement.column]
+                if self.fits(rotated, row):
+                    self.active = (rotated, row)
+
+    def pick_next_piece(self):
+        self.next_piece = self.sequence[self.drawn]
+        self.drawn += 1
+
+    def position(self) -> tuple[int, int, int] | None:
+        """
+        Orientation, column and row of the active piece's bounding box.
+        """
+        if not self.active:
+            return None
+        placement, row = self.active
+        return placement.orientation, placement.column, row
+
+    def set_piece(self, piece: Mapping):
+        """
+        Replace the active piece with a newly spawned one, for looking ahead at
+        pieces that are not known yet.
+        """
+        self.spawn(piece)
+
+    def spawn_fits(self, piece: Mapping) -> bool:
+        """
+        Whether a piece can spawn, clear of the locked blocks.
+        """
+        rowoffset, coloffset = SPAWN_OFFSETS[piece["name"]]
+        placement = self.table[piece["name"]][0][coloffset + int(self.width / 2) - 1]
+        return self.fits(placement, rowoffset)
+
+    def spawn(self, piece: Mapping):
+        """
+        Checks and spawns a piece if it can.
+        Sets self.current_piece to the new piece and
+        self.active to its spawn placement.
+        """
+        if self.recorder is not None:
+            self.recorder.spawn(self.score)
+        self.active = None
+        if not self.spawn_fits(piece):
+            self.defeated = True
+            return
+        rowoffset, coloffset = SPAWN_OFFSETS[piece["name"]]
+        self.current_piece = piece
+        self.active = (
+            self.table[piece["name"]][0][coloffset + int(self.width / 2) - 1],
+            rowoffset,
+        )
+
+    @property
+    def active_coords(self) -> list[tuple[int, int]] | None:
+        if not self.active:
+            return None
+        placement, row = self.active
+        return [(row + rowoffset, col) for rowoffset, col in placement.cells]
+
+    def get_height(self):
+        return self.filled_rows
+
+    def count_holes(self):
+        return self.holes
+
+    def count_wells(self):
+        return self.wells
+
+    def holes_between(self, first: int, stop: int) -> int:
+        """
+        Empty cells directly under a block in rows first to stop - 1.
+        """
+        full = self.full_mask
+        rows = self.rows
+        return sum(
+            (rows[rowindex - 1] & ~rows[rowindex] & full).bit_count()
+            for rowindex in range(max(first, 1), min(stop, self.height))
+        )
+
+    def wells_between(self, first: int, stop: int) -> int:
+        """
+        Wells in rows first to stop - 1: empty cells with a block below, two
+        empty cells above and blocks or walls either side of those two.
+        """
+        full = self.full_mask
+        # masks of columns whose left/right neighbour is filled or a wall
+        left_wall = 1
+        right_wall = 1 << (self.width - 1)
+        rows = self.rows
+        count = 0
+        for rowindex in range(max(first, 4), min(stop, self.height)):
+            above = rows[rowindex - 1]
+            above2 = rows[rowindex - 2]
+            below = full if rowindex == self.height - 1 else rows[rowindex + 1]
+            wells = (
+                ~rows[rowindex]
+                & below
+                & ~above
+                & ((above << 1) | left_wall)
+                & ((above >> 1) | right_wall)
+                & ~above2
+                & ((above2 << 1) | left_wall)
+                & ((above2 >> 1) | right_wall)
+                & full
+            )
+            count += wells.bit_count()
+        return count
+
+    def row_masks(self) -> list[int]:
+        """
+        Locked blocks of each row as a bitmask, bit c being column c.
+        """
+        return self.rows
+
+    def to_grid(self) -> list[list[str | bool | None]]:
+        """
+        The board as a main.Board style grid including the active piece.
+        Cells are colours when the colour plane is kept, otherwise True.
+        """
+        grid: list[list[str | bool | None]] = [
+            [
+                (
+                    (self.colours[rownum][colnum] if self.colours else None) or True
+                    if row >> colnum & 1
+                    else None
+                )
+                for colnum in range(self.width)
+            ]
+            for rownum, row in enumerate(self.rows)
+        ]
+        if self.active_coords:
+            for row, col in self.active_coords:
+                grid[row][col] = (
+                    self.current_piece["colour"] if self.colours is not None else True
+                )
+        return grid
+
+    def game_over(self):
+        print("GAME OVER")
+
+    def __getstate__(self) -> dict:
+        """
+        The board's own state for pickling, with pieces by name. The piece,
+        placement and Zobrist tables are rebuilt from the board size when
+        unpickled, so sending a board to another process stays cheap.
+        """
+        state = self.__dict__.copy()
+        for name in ("pieces", "table", "zobrist"):
+            del state[name]
+        state["recorder"] = None
+        for name in ("current_piece", "next_piece", "saved_piece"):
+            if state.get(name):
+                state[name] = state[name]["name"]
+        if self.active:
+            placement, row = self.active
+            state["active"] = (
+                placement.name,
+                placement.orientation,
+                placement.column,
+                row,
+            )
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.pieces = PIECES
+        self.table = piece_table(self.width)
+        self.zobrist = zobrist_table(self.height, self.width)
+        for name in ("current_piece", "next_piece", "saved_piece"):
+            if state.get(name):
+                setattr(self, name, PIECES[state[name]])
+        if self.active:
+            piece, orientation, column, row = self.active
+            self.active = (self.table[piece][orientation][column], row)
+
+    def copy(self):
+        copied_obj = type(self).__new__(type(self))
+        copied_obj.__dict__.update(self.__dict__)
+        copied_obj.rows = self.rows[:]
+        copied_obj.heights = self.heights[:]
+        copied_obj.recorder = None
+        if self.colours is not None:
+            copied_obj.colours = [row[:] for row in self.colours]
+        return copied_obj
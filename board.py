@@ -0,0 +1,633 @@
+from typing import Mapping, Sequence
+
+from pieces import PieceSequence, ORIENTATIONS, PIECE_IDS, PIECES, SPAWN_OFFSETS
+from rules import PlaceEvent, line_clear_score
+from zobrist import zobrist_table
+
+# Cells hold a small id for the piece that filled them, 0 being empty, and
+# COLOURS turns them back into colour names for drawing
+CELLS = {name: index + 1 for name, index in PIECE_IDS.items()}
+COLOURS: list[str | None] = [None] + [piece["colour"] for piece in PIECES.values()]
+
+
+class Board:
+    """
+    Board class for containing the tetris board.
+    """
+
+    __slots__ = (
+        "pieces",
+        "sequence",
+        "drawn",
+        "width",
+        "height",
+        "board",
+        "active_coords",
+        "heights",
+        "filled_rows",
+        "holes",
+        "wells",
+        "landing_height",
+        "eroded_cells",
+        "zobrist",
+        "hash",
+        "orientation",
+        "origin",
+        "current_piece",
+        "next_piece",
+        "saved_piece",
+        "score",
+        "difficult_combo",
+        "total_pieces",
+        "hold_used",
+        "defeated",
+        "recorder",
+    )
+
+    def __init__(
+        self,
+        width: int = 10,
+        height: int = 20,
+        board: list[list[int]] | None = None,
+        seed: int | None = None,
+        mode: str = "uniform",
+        sequence: PieceSequence | None = None,
+    ):
+        self.pieces = PIECES
+        # Pieces are dealt from a sequence of the board's own, or a shared one
+        # when given, with drawn counting the pieces taken from it so far
+        self.sequence = sequence if sequence is not None else PieceSequence(seed, mode)
+        self.drawn = 0
+        self.width = width
+        self.height = height
+        self.board: list[list[int]]
+        if board:
+            self.board = board
+        else:
+            self.board = [[0] * self.width for _ in range(self.height)]
+        self.active_coords: list[tuple[int, int]] | None = None
+        # Board features, kept up to date as pieces lock and lines clear
+        self.heights: list[int] = [0] * self.width
+        self.filled_rows = 0
+        self.holes = 0
+        self.wells = 0
+        # Rows under the last piece locked, and its cells in the lines it
+        # completed times the number of those lines
+        self.landing_height = 0
+        self.eroded_cells = 0
+        # Zobrist hash of the locked cells
+        self.zobrist = zobrist_table(height, width)
+        self.hash = 0
+        self.reset_features()
+        # orientation index and top left of the active piece's bounding box
+        self.orientation = 0
+        self.origin = (0, 0)
+        self.saved_piece: Mapping | None = None
+        self.score: int = 0
+        self.difficult_combo = 0
+        self.total_pieces = 0
+        self.hold_used = False
+        self.defeated = False
+        # replay.Recorder logging this board's placements, if any
+        self.recorder = None
+        self.pick_next_piece()
+        self.update()
+
+    def update(self, tick=False):
+        self.clear_lines()
+
+        if not self.active_coords:
+            self.spawn(self.next_piece)
+            self.total_pieces += 1
+            self.pick_next_piece()
+            self.hold_used = False
+
+        if tick and self.active_coords:
+            self.input("GRAVITY")
+
+    def clear_lines(self) -> tuple[int, bool]:
+        """
+        Clear full rows and score them.
+        Returns the number of lines cleared and whether it was a perfect clear.
+        """
+        cleared_lines = 0
+        for rowindex, row in enumerate(self.board):
+            if all(row):
+                self.board.pop(rowindex)
+                self.board.insert(0, [0] * self.width)
+                cleared_lines += 1
+        if not cleared_lines:
+            return 0, False
+        self.reset_features()
+        # increase the combo if a tetris is scored
+        if cleared_lines == 4:
+            self.difficult_combo += 1
+        else:
+            self.difficult_combo = 0
+        perfect_clear = not any(self.board[-1])
+        self.score += line_clear_score(
+            cleared_lines, self.difficult_combo, perfect_clear
+        )
+        return cleared_lines, perfect_clear
+
+    def input(self, key: str | Sequence[str], update: bool = True):
+
+        # If only one key was given, convert to list
+        keys = [key] if type(key) is not list else key
+        # print(keys)
+
+        successes = []
+
+        for key in keys:
+            horiz = 0
+            verti = 0
+            rot = 0
+            if key == "RIGHT":
+                horiz += 1
+            if key == "LEFT":
+                horiz -= 1
+            if key == "GRAVITY":
+                verti += 1
+            if key == "HARDDROP":
+                while self.active_coords:
+                    self.input("GRAVITY", update=False)
+                    self.score += 2
+            if key == "ROT_CLOCKWISE":
+                rot -= 1
+            if key == "ROT_ANTICLOCKWISE":
+                rot += 1
+
+            if key == "HOLD" and self.active_coords and not self.hold_used:
+                self.hold_used = True
+                old_piece = self.current_piece
+
+                # wipe the old piece from the board
+                for coord in self.active_coords:
+                    self.board[coord[0]][coord[1]] = 0
+
+                if self.saved_piece:
+                    self.spawn(self.saved_piece)
+                else:
+                    self.spawn(self.next_piece)
+                    self.total_pieces += 1
+                    self.pick_next_piece()
+
+                self.saved_piece = old_piece
+
+            if self.active_coords:
+                # Rotate the piece if we need to
+                if rot:
+                    self.rotate(rot)
+                # Check each tile to see if we can move
+                can_move = True
+                for coord in self.active_coords:
+                    if (
+                        coord[0] + verti >= self.height
+                        or coord[0] + verti < 0
+                        or coord[1] + horiz < 0
+                        or coord[1] + horiz >= self.width
+                    ):
+                        can_move = False
+                        break
+                    elif (
+                        self.board[coord[0] + verti][coord[1] + horiz]
+                        and (coord[0] + verti, coord[1] + horiz)
+                        not in self.active_coords
+                    ):
+                        can_move = False
+                        break
+
+                # If we can move, update self.current_piece and self.board
+                if can_move:
+                    repositioned_piece: list[tuple[int, int]] = []
+                    for coord in self.active_coords:
+                        self.board[coord[0] + verti][coord[1] + horiz] = self.board[
+                            coord[0]
+                        ][coord[1]]
+                        if (
+                            not (coord[0] - verti, coord[1] - horiz)
+                            in self.active_coords
+                        ):
+                            self.board[coord[0]][coord[1]] = 0
+                        repositioned_piece.append((coord[0] + verti, coord[1] + horiz))
+                    self.active_coords = repositioned_piece
+                    self.origin = (self.origin[0] + verti, self.origin[1] + horiz)
+                    successes.append(True)
+                elif key == "GRAVITY":
+                    self.lock()
+
+                if not can_move:
+                    successes.append(False)
+            else:
+                if key == "HARDDROP":
+                    successes.append(True)
+                else:
+                    successes.append(False)
+
+        if update:
+            self.update(tick=False)
+        return successes
+
+    def rotate(self, rotation):
+        if not self.active_coords:
+            return
+
+        # convert negative rotations into positive
+        while rotation < 0:
+            rotation += 4
+
+        rotation %= 4
+
+        orientations = ORIENTATIONS[self.current_piece["name"]]
+        for _ in range(abs(rotation)):
+            # each turn is anticlockwise about the top left of the bounding box
+            orientation = (self.orientation + 1) % len(orientations)
+            rowoffset, coloffset = self.origin
+            rotated_piece = [
+                (row + rowoffset, col + coloffset)
+                for row, col in orientations[orientation]
+            ]
+
+            can_move = True
+            for index, coord in enumerate(rotated_piece):
+                if (
+                    coord[0] >= self.height
+                    or coord[0] < 0
+                    or coord[1] < 0
+                    or coord[1] >= self.width
+                ):
+                    can_move = False
+                    break
+                elif (
+                    self.board[coord[0]][coord[1]]
+                    and (coord[0], coord[1]) not in self.active_coords
+                ):
+                    can_move = False
+                    break
+
+            if can_move:
+                # sample colour from old piece
+                col = self.board[self.active_coords[0][0]][self.active_coords[0][1]]
+                for coord in self.active_coords:
+                    self.board[coord[0]][coord[1]] = 0
+                for coord in rotated_piece:
+                    self.board[coord[0]][coord[1]] = col
+
+                self.active_coords = rotated_piece
+                self.orientation = orientation
+
+    def place(
+        self, piece: str, orientation: int, column: int, row: int | None = None
+    ) -> PlaceEvent:
+        """
+        Drop the named piece straight down in the given orientation with the
+        left of its bounding box at column, lock it and spawn the next piece.
+
+        The piece may be the current piece or, if hold is available, the one
+        HOLD would swap in. Scoring matches a hard drop from the active
+        piece's row followed by update(). Giving row locks the top of the
+        piece there instead, for replaying pieces slid under an overhang.
+        Everything is checked before the HOLD, so a place() that raises
+        leaves the board as it was.
+        """
+        if not self.active_coords:
+            raise ValueError("There is no active piece to place")
+        holding = piece != self.current_piece["name"]
+        if holding:
+            held = self.saved_piece or self.next_piece
+            if self.hold_used or piece != held["name"]:
+                raise ValueError(f"Piece {piece} is not available to place")
+            if not self.spawn_fits(held):
+                # the HOLD itself tops out, wherever the piece was to go
+                self.input("HOLD", update=False)
+                return PlaceEvent(0, 0, False)
+
+        orientations = ORIENTATIONS[piece]
+        if not 0 <= orientation < len(orientations):
+            raise ValueError(f"Piece {piece} has no orientation {orientation}")
+        cells = orientations[orientation]
+        piece_width = max(cell[1] for cell in cells) + 1
+        if not 0 <= column <= self.width - piece_width:
+            raise ValueError(f"Piece {piece} does not fit at column {column}")
+
+        # a held piece starts from where it spawns
+        start = SPAWN_OFFSETS[piece][0] if holding else self.origin[0]
+        if row is None:
+            # drop onto the highest block under each column of the piece
+            bottom: dict[int, int] = {}
+            for rowoffset, col in cells:
+                bottom[col] = max(bottom.get(col, 0), rowoffset)
+            landing = (
+                min(
+                    self.height - self.heights[column + col] - rowoffset
+                    for col, rowoffset in bottom.items()
+                )
+                - 1
+            )
+            if landing < start:
+                raise ValueError(f"Piece {piece} is blocked at column {column}")
+        else:
+            landing = row
+            for rowoffset, col in cells:
+                if not 0 <= landing + rowoffset < self.height or (
+                    self.board[landing + rowoffset][column + col]
+                    and (landing + rowoffset, column + col) not in self.active_coords
+                ):
+                    raise ValueError(f"Piece {piece} does not fit at row {row}")
+
+        if holding:
+            self.input("HOLD", update=False)
+        score = self.score
+        colour = self.board[self.active_coords[0][0]][self.active_coords[0][1]]
+        for coord in self.active_coords:
+            self.board[coord[0]][coord[1]] = 0
+        self.active_coords = [
+            (landing + rowoffset, column + col) for rowoffset, col in cells
+        ]
+        for coord in self.active_coords:
+            self.board[coord[0]][coord[1]] = colour
+        self.orientation = orientation
+        self.origin = (landing, column)
+        self.score += 2 * (landing - start + 1)
+        self.lock()
+        cleared_lines, perfect_clear = self.clear_lines()
+        self.update()
+        return PlaceEvent(cleared_lines, self.score - score, perfect_clear)
+
+    def lock(self):
+        """
+        Fix the active piece in place and update the board features and hash.
+        """
+        if self.recorder is not None:
+            self.recorder.lock(
+                self.current_piece["name"],
+                self.orientation,
+                self.origin[1],
+                self.origin[0],
+                self.hold_used,
+            )
+        cells = self.active_coords
+        colour = self.board[cells[0][0]][cells[0][1]]
+        # only rows next to the piece can change their hole and well counts
+        first = min(coord[0] for coord in cells) - 1
+        stop = max(coord[0] for coord in cells) + 3
+        for coord in cells:
+            self.board[coord[0]][coord[1]] = 0
+        holes = self.holes_between(first, stop)
+        wells = self.wells_between(first, stop)
+        for coord in cells:
+            if not any(self.board[coord[0]]):
+                self.filled_rows += 1
+            self.board[coord[0]][coord[1]] = colour
+            self.heights[coord[1]] = max(self.heights[coord[1]], self.height - coord[0])
+            self.hash ^= self.zobrist[coord[0]][coord[1]]
+        completed = [coord for coord in cells if all(self.board[coord[0]])]
+        self.landing_height = self.height - 1 - max(coord[0] for coord in cells)
+        self.eroded_cells = len({coord[0] for coord in completed}) * len(completed)
+        self.holes += self.holes_between(first, stop) - holes
+        self.wells += self.wells_between(first, stop) - wells
+        self.active_coords = None
+
+    def column_heights(self) -> list[int]:
+        """
+        Height of the highest locked block in each column.
+        """
+        return self.heights[:]
+
+    def reset_features(self):
+        """
+        Recount the column heights, filled rows, holes, wells and hash from
+        scratch, ignoring the active piece.
+        """
+        active = self.active_coords or []
+        colours = [self.board[coord[0]][coord[1]] for coord in active]
+        for coord in active:
+            self.board[coord[0]][coord[1]] = 0
+
+        self.heights = [0] * self.width
+        for col in range(self.width):
+            for rowindex in range(self.height):
+                if self.board[rowindex][col]:
+                    self.heights[col] = self.height - rowindex
+                    break
+        self.filled_rows = sum(1 for row in self.board if any(row))
+        self.holes = self.holes_between(0, self.height)
+        self.wells = self.wells_between(0, self.height)
+        self.hash = 0
+        for rowindex, row in enumerate(self.board):
+            for colindex, cell in enumerate(row):
+                if cell:
+                    self.hash ^= self.zobrist[rowindex][colindex]
+
+        for coord, colour in zip(active, colours):
+            self.board[coord[0]][coord[1]] = colour
+
+    def pick_next_piece(self):
+        self.next_piece = self.sequence[self.drawn]
+        self.drawn += 1
+
+    def position(self) -> tuple[int, int, int] | None:
+        """
+        Orientation, column and row of the active piece's bounding box.
+        """
+        if not self.active_coords:
+            return None
+        return self.orientation, self.origin[1], self.origin[0]
+
+    def set_piece(self, piece: Mapping):
+        """
+        Replace the active piece with a newly spawned one, for looking ahead at
+        pieces that are not known yet.
+        """
+        for row, col in self.active_coords or []:
+            self.board[row][col] = 0
+        self.spawn(piece)
+
+    def spawn_fits(self, piece: Mapping) -> bool:
+        """
+        Whether a piece can spawn, clear of every block but the active
+        piece's own.
+        """
+        active = self.active_coords or []
+        for rownum, row in enumerate(piece["shape"]):
+            for colnum, cell in enumerate(row):
+                coord = (rownum, colnum + int(self.width / 2) - 1)
+                if cell and self.board[coord[0]][coord[1]] and coord not in active:
+                    return False
+        return True
+
+    def spawn(self, piece: Mapping):
+        """
+        Checks and spawns a piece if it can.
+        Sets self.current_piece to the new piece and
+        self.active_coords to the new piece's active coordinates.
+
+        piece: {
+            "shape": ((0, 1, 0), ... ),
+            "colour": "red",
+        }
+        The active piece's cells are filled with its id from CELLS.
+        """
+        if self.recorder is not None:
+            self.recorder.spawn(self.score)
+        self.active_coords = []
+        if not self.spawn_fits(piece):
+            self.defeated = True
+            return
+        # piece definitions are shared and never changed, so no copy is needed
+        self.current_piece = piece
+        self.orientation = 0
+        rowoffset, coloffset = SPAWN_OFFSETS[piece["name"]]
+        self.origin = (rowoffset, coloffset + int(self.width / 2) - 1)
+        # spawn new piece
+        cell_id = CELLS[piece["name"]]
+        for rownum, row in enumerate(piece["shape"]):
+            for colnum, cell in enumerate(row):
+                if cell:
+                    self.board[rownum][colnum + int(self.width / 2) - 1] = cell_id
+                    self.active_coords.append(
+                        (rownum, colnum + int(self.width / 2) - 1)
+                    )
+
+    def get_height(self):
+        return self.filled_rows
+
+    def count_holes(self):
+        return self.holes
+
+    def count_wells(self):
+        return self.wells
+
+    def holes_between(self, first: int, stop: int) -> int:
+        """
+        Empty cells directly under a block in rows first to stop - 1.
+        """
+        count = 0
+        for rowindex in range(max(first, 1), min(stop, self.height)):
+            above = self.board[rowindex - 1]
+            for colindex, cell in enumerate(self.board[rowindex]):
+                if above[colindex] and not cell:
+                    count += 1
+        return count
+
+    def wells_between(self, first: int, stop: int) -> int:
+        """
+        Wells in rows first to stop - 1: empty cells with a block below, two
+        empty cells above and blocks or walls either side of those two.
+        """
+        board = self.board
+        count = 0
+        for rowindex in range(max(first, 4), min(stop, self.height)):
+            for colindex, cell in enumerate(board[rowindex]):
+                # If this cell is empty and there is a cell below and
+                # two empty cells above and cells to either side
+                if (
+                    (not cell)
+                    and (rowindex == self.height - 1 or board[rowindex + 1][colindex])
+                    and (not board[rowindex - 1][colindex])
+                    and (
+                        colindex == (self.width - 1)
+                        or board[rowindex - 1][colindex + 1]
+                    )
+                    and (colindex == 0 or board[rowindex - 1][colindex - 1])
+                    and (not board[rowindex - 2][colindex])
+                    and (
+                        colindex == (self.width - 1)
+                        or board[rowindex - 2][colindex + 1]
+                    )
+                    and (colindex == 0 or board[rowindex - 2][colindex - 1])
+                ):
+                    count += 1
+        return count
+
+    def row_masks(self) -> list[int]:
+        """
+        Locked blocks of each row as a bitmask, bit c being column c.
+        """
+        active = set(self.active_coords or [])
+        return [
+            sum(
+                1 << colindex
+                for colindex, cell in enumerate(row)
+                if cell and (rowindex, colindex) not in active
+            )
+            for rowindex, row in enumerate(self.board)
+        ]
+
+    def to_grid(self) -> list[list[str | None]]:
+        """
+        The board grid including the active piece, with colour names for
+        cells.
+        """
+        return [[COLOURS[cell] for cell in row] for row in self.board]
+
+    def game_over(self):
+        # TODO: Game over events
+        print("GAME OVER")
+
+    def __getstate__(self) -> dict:
+        """
+        The board's own state for pickling, with pieces by name. The piece
+        definitions and Zobrist table are shared, and rebuilt from the board
+        size when unpickled.
+        """
+        state = {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if name not in ("pieces", "zobrist", "recorder") and hasattr(self, name)
+        }
+        for name in ("current_piece", "next_piece", "saved_piece"):
+            if state.get(name):
+                state[name] = state[name]["name"]
+        return state
+
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.pieces = PIECES
+        self.zobrist = zobrist_table(self.height, self.width)
+        self.recorder = None
+        for name in ("current_piece", "next_piece", "saved_piece"):
+            if state.get(name):
+                setattr(self, name, PIECES[state[name]])
+
+    def copy(self):
+        """
+        A copy sharing the immutable state, made without __init__, which would
+        build and spawn into a grid only to have it replaced.
+        """
+        copied_obj = type(self).__new__(type(self))
+        copied_obj.pieces = self.pieces
+        copied_obj.sequence = self.sequence
+        copied_obj.drawn = self.drawn
+        copied_obj.width = self.width
+        copied_obj.height = self.height
+        copied_obj.board = [row[:] for row in self.board]
+        copied_obj.active_coords = (
+            self.active_coords[:] if self.active_coords is not None else None
+        )
+        copied_obj.heights = self.heights[:]
+        copied_obj.filled_rows = self.filled_rows
+        copied_obj.holes = self.holes
+        copied_obj.wells = self.wells
+        copied_obj.landing_height = self.landing_height
+        copied_obj.eroded_cells = self.eroded_cells
+        copied_obj.zobrist = self.zobrist
+        copied_obj.hash = self.hash
+        copied_obj.orientation = self.orientation
+        copied_obj.origin = self.origin
+        copied_obj.current_piece = self.current_piece
+        copied_obj.next_piece = self.next_piece
+        copied_obj.saved_piece = self.saved_piece
+        copied_obj.score = self.score
+        copied_obj.difficult_combo = self.difficult_combo
+        copied_obj.total_pieces = self.total_pieces
+        copied_obj.hold_used = self.hold_used
+        copied_obj.defeated = self.defeated
+        copied_obj.recorder = None
+        return copied_obj
+
+
+def board_array_copy(board: list[list[int]]):
+    # return copy.deepcopy(board)
+    return [x.copy() for x in board]
@@ -1,6 +1,78 @@
+from collections import OrderedDict
 from multiprocessing import Pool
 import random
-from typing import Sequence
+import time
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+import batch
+import features as features_module
+import movegen
+from pieces import PIECES, PieceSequence
+
+# Ways calculate_move can score candidate placements
+EVALUATORS = ("sort", "numpy")
+# Ways find_permutations can generate them: every column after each
+# rotation, or every placement reachable with soft drops, slides and turns
+GENERATORS = ("permutations", "reachable")
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class Line(NamedTuple):
+    """
+    A line of play kept in the search beam: the index of the first placement
+    it starts with, the boards it has reached, each as likely as the others,
+    and their mean evaluation.
+    """
+
+    value: float
+    root: int
+    boards: list
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the lookahead search when the time budget for a move runs out.
+    """
+
+
+# The client and piece sequence each search worker process searches with
+worker_client: "TetrisClient | None" = None
+worker_sequence: PieceSequence | None = None
+
+
+def init_search_worker(settings: dict):
+    global worker_client, worker_sequence
+    worker_client = TetrisClient(None, **settings)
+    worker_sequence = PieceSequence()
+
+
+def expand_line(task) -> list[Line] | None:
+    """
+    expand() of one line of a search, in a search worker. Returns None if the
+    time budget ran out. The boards come back without their piece sequence.
+    """
+    line, weights, known, deadline = task
+    # pieces past known are never looked at, so any sequence will do
+    for board in line.boards:
+        board.sequence = worker_sequence
+    worker_client.board = line.boards[0]
+    worker_client.weights = weights
+    try:
+        lines = worker_client.expand(line, known, deadline)
+    except SearchTimeout:
+        return None
+    for child in lines:
+        for board in child.boards:
+            board.sequence = None
+    return lines
 
 
 class TetrisClient:
@@ -10,9 +82,54 @@ class TetrisClient:
         weights: Sequence[float] = [1.58865303, 0.3142535, 1.24303428, 0.81636418],
         # weights: Sequence[float] = [1.588, 0.45, 1.243, 0.816],
         # weights: Sequence[float] = [0.000000001, 1, 0, 1],
+        evaluator: str = "sort",
+        cache_size: int = 0,
+        depth: int = 1,
+        beam_width: int = 8,
+        expectimax: bool = False,
+        time_budget: float | None = None,
+        generator: str = "permutations",
+        workers: int = 0,
+        parallel_depth: int = 2,
+        features: Sequence[str] | None = None,
     ):
+        if evaluator not in EVALUATORS:
+            raise ValueError(
+                f"Unknown evaluator {evaluator}, expected one of {EVALUATORS}"
+            )
+        if generator not in GENERATORS:
+            raise ValueError(
+                f"Unknown generator {generator}, expected one of {GENERATORS}"
+            )
+        if features is not None:
+            features_module.check(features, weights)
         self.weights = weights
+        # features.py features to evaluate with, the weights being one for
+        # the score and one per feature, instead of holes, height and wells
+        self.features = features
         self.board = board
+        self.evaluator = evaluator
+        self.generator = generator
+        # LRU cache of the position part of the evaluation, keyed by the
+        # board's Zobrist hash and the weights. Disabled when cache_size is 0.
+        self.cache_size = cache_size
+        self.cache: OrderedDict[tuple, tuple[float, float, float]] = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Lookahead: pieces placed ahead per move (1 is greedy), lines of play
+        # kept at each ply, whether to average over the pieces after the
+        # preview, and the seconds allowed per move (None is unlimited)
+        self.depth = depth
+        self.beam_width = beam_width
+        self.expectimax = expectimax
+        self.time_budget = time_budget
+        # Process pool the lines of a search are split across, started on
+        # first use, from the ply parallel_depth pieces past the first
+        # placement on. The plies before it, ending at the preview piece,
+        # are too quick to be worth sending out.
+        self.workers = workers
+        self.parallel_depth = parallel_depth
+        self.pool: Pool | None = None
 
     def update(self, tick: bool = False):
         self.board.update(tick=tick)
@@ -24,7 +141,16 @@ class TetrisClient:
         self.board.input(self.calculate_move())
 
     def calculate_move(self) -> Sequence[str]:
-        perms = self.find_permutations(self.board)
+        return self.choose(self.find_permutations(self.board))
+
+    def choose(self, perms) -> Sequence[str]:
+        """
+        Moves of the best of the permutations of the board's current piece.
+        """
+        if perms and self.depth > 1:
+            return self.search(perms)
+        if perms and self.evaluator == "numpy":
+            return perms[int(np.argmax(self.batch_scores(perms)))]["moves"]
         if perms:
             ## APPROACH 1
 
@@ -43,18 +169,240 @@ class TetrisClient:
             # best = max(lowest_holes, key=lambda x: x["board"].score)
             # return best["moves"]
 
-            perms.sort(
-                key=lambda perm: perm["board"].defeated
-                * ((perm["board"].score * self.weights[0]))
-                / ((perm["board"].count_holes() * self.weights[1]) + 1)
-                / ((perm["board"].get_height() * self.weights[2]) + 1)
-                / (((max(perm["board"].count_wells(), 1) - 1) * self.weights[3]) + 1),
-                reverse=True,
-            )
+            perms.sort(key=lambda perm: self.evaluate(perm["board"]), reverse=True)
             return perms[0]["moves"]
         return []
 
+    def search(self, perms) -> Sequence[str]:
+        """
+        Look self.depth pieces ahead a ply at a time, following up every
+        line of play kept so far and keeping the beam_width best lines over
+        all of them, and return the moves of the placement the best line
+        starts with. When the time budget runs out the best line of the last
+        finished ply decides.
+        """
+        deadline = None
+        if self.time_budget is not None:
+            deadline = time.perf_counter() + self.time_budget
+        # the current piece is number total_pieces and the preview the next one
+        known = self.board.total_pieces + 1
+        lines = self.beam(
+            [
+                Line(self.evaluate(perm["board"]), index, [perm["board"]])
+                for index, perm in enumerate(perms)
+            ]
+        )
+        for ply in range(1, self.depth):
+            try:
+                if self.workers > 1 and ply >= self.parallel_depth:
+                    children = self.parallel_expand(lines, known, deadline)
+                else:
+                    children = [
+                        child
+                        for line in lines
+                        for child in self.expand(line, known, deadline)
+                    ]
+            except SearchTimeout:
+                break
+            lines = self.beam(children)
+        return perms[lines[0].root]["moves"]
+
+    def parallel_expand(
+        self, lines: list[Line], known: int, deadline: float | None
+    ) -> list[Line]:
+        """
+        expand() of each line, one per task on the search workers. The boards
+        are sent without their piece sequence.
+        """
+        if self.pool is None:
+            # the weights are sent with every task as well, but the worker
+            # client has to be made with as many as its features need
+            settings = {
+                "weights": list(self.weights),
+                "evaluator": self.evaluator,
+                "cache_size": self.cache_size,
+                "beam_width": self.beam_width,
+                "expectimax": self.expectimax,
+                "generator": self.generator,
+                "features": self.features,
+            }
+            self.pool = Pool(
+                self.workers, initializer=init_search_worker, initargs=(settings,)
+            )
+        tasks = []
+        for line in lines:
+            boards = [board.copy() for board in line.boards]
+            for board in boards:
+                board.sequence = None
+            tasks.append(
+                (line._replace(boards=boards), list(self.weights), known, deadline)
+            )
+        results = self.pool.map(expand_line, tasks, chunksize=1)
+        if None in results:
+            raise SearchTimeout
+        children = [child for result in results for child in result]
+        for child in children:
+            for board in child.boards:
+                board.sequence = self.board.sequence
+        return children
+
+    def close(self):
+        """
+        Stop the search workers, if they were started.
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def beam(self, lines: list[Line]) -> list[Line]:
+        """
+        The beam_width lines with the best values, best first.
+        """
+        return sorted(lines, key=lambda line: line.value, reverse=True)[
+            : self.beam_width
+        ]
+
+    def expand(self, line: Line, known: int, deadline: float | None) -> list[Line]:
+        """
+        The lines one piece on from line. Pieces numbered above known have
+        not been seen yet: with expectimax every board of the line is
+        followed by the best placement of each piece in turn, all in one
+        line, otherwise the line stops. When the piece is known each
+        placement is a line of its own. A line that cannot go on is kept as
+        it is.
+        """
+        if deadline is not None and time.perf_counter() > deadline:
+            raise SearchTimeout
+        board = line.boards[0]
+        if len(line.boards) == 1 and board.total_pieces <= known:
+            if board.defeated:
+                return [line]
+            perms = self.placements(board, known)
+            if not perms:
+                return [line]
+            return [
+                Line(self.evaluate(perm["board"]), line.root, [perm["board"]])
+                for perm in perms
+            ]
+        if not self.expectimax:
+            return [line]
+        boards = []
+        total = 0.0
+        for board in line.boards:
+            for piece in PIECES.values():
+                guess = board
+                if not board.defeated:
+                    guess = board.copy()
+                    guess.set_piece(piece)
+                perms = self.placements(guess, known) if not guess.defeated else []
+                values = [self.evaluate(perm["board"]) for perm in perms]
+                if values:
+                    best = values.index(max(values))
+                    boards.append(perms[best]["board"])
+                    total += values[best]
+                else:
+                    boards.append(guess)
+                    total += self.evaluate(guess)
+        return [Line(total / len(boards), line.root, boards)]
+
+    def placements(self, board, known: int):
+        """
+        find_permutations() of a board in a search, leaving out HOLD when the
+        piece it would bring in is not known.
+        """
+        unknown_hold = board.saved_piece is None and board.total_pieces >= known
+        return [
+            perm
+            for perm in self.find_permutations(board)
+            if not (unknown_hold and perm["moves"][0] == "HOLD")
+        ]
+
+    def evaluate(self, board) -> float:
+        """
+        Weighted score of a board after a move, higher being better.
+        """
+        if self.features is not None:
+            # not cached, as the last lock's features are not in the hash
+            return features_module.evaluate(
+                self.weights,
+                self.features,
+                board.score,
+                features_module.extract(board, self.features),
+                board.defeated,
+            )
+        holes, height, wells = self.position_terms(board)
+        return (
+            (not board.defeated)
+            * ((board.score * self.weights[0]))
+            / holes
+            / height
+            / wells
+        )
+
+    def position_terms(self, board) -> tuple[float, float, float]:
+        """
+        The hole, height and well divisors of the evaluation. These depend only
+        on the locked cells, so they are cached by the board's hash.
+        """
+        if self.cache_size:
+            key = (board.hash, tuple(self.weights))
+            terms = self.cache.get(key)
+            if terms is not None:
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                return terms
+            self.cache_misses += 1
+
+        terms = (
+            (board.count_holes() * self.weights[1]) + 1,
+            (board.get_height() * self.weights[2]) + 1,
+            ((max(board.count_wells(), 1) - 1) * self.weights[3]) + 1,
+        )
+        if self.cache_size:
+            self.cache[key] = terms
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return terms
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(
+            self.cache_hits, self.cache_misses, self.cache_size, len(self.cache)
+        )
+
+    def batch_scores(self, perms) -> np.ndarray:
+        """
+        Score every permutation at once from a stacked grid of the resulting
+        boards, using the same formula as the sort evaluator.
+        """
+        boards = [perm["board"] for perm in perms]
+        if self.features is not None:
+            return features_module.evaluate_many(
+                self.weights,
+                self.features,
+                np.array([b.score for b in boards]),
+                features_module.from_rows(
+                    np.array([b.row_masks() for b in boards]),
+                    self.board.width,
+                    self.features,
+                    landing_height=np.array([b.landing_height for b in boards]),
+                    eroded_cells=np.array([b.eroded_cells for b in boards]),
+                ),
+                np.array([b.defeated for b in boards]),
+            )
+        grids = batch.stack_rows([b.row_masks() for b in boards], self.board.width)
+        return batch.evaluate(
+            self.weights,
+            np.array([b.score for b in boards]),
+            batch.count_holes(grids),
+            batch.get_height(grids),
+            batch.count_wells(grids),
+            np.array([b.defeated for b in boards]),
+        )
+
     def find_permutations(self, board):
+        if self.generator == "reachable":
+            return movegen.find_placements(board)
+
         permutations = []
 
         hardleft = ["LEFT" for _ in range(self.board.width)]
@@ -0,0 +1,277 @@
+"""
+Streams the decisions of seeded client games to .npy files for offline
+analysis and weight fitting.
+
+    python dataset.py data/ --games 100                 play seeds 0 to 99
+    python dataset.py data/ --games 100                 ... then 100 to 199
+    python dataset.py data/ --games 10 --max-pieces 500 --generator reachable
+
+A directory holds one file per array, all growing together as games are
+played. Every decision point is a row of the decision arrays, and every
+candidate placement considered at it a row of the candidate arrays:
+
+    rows       uint32 (decisions, height)  locked blocks as row bitmasks,
+                                           bit c being column c
+    pieces     int8   (decisions, 3)       current, next and saved piece ids,
+                                           -1 when nothing is saved
+    seeds      int64  (decisions,)         seed of the game
+    first      int64  (decisions,)         its first candidate
+    count      int32  (decisions,)         how many candidates it has
+    chosen     int32  (decisions,)         which of them the client played
+    features   int32  (candidates, 4)      holes, height, wells and score
+                                           delta after the placement
+
+Decisions are buffered in chunks and appended to the files, so memory use
+stays flat however long the run. The files are ordinary .npy files, opened
+zero-copy with load(), and batch.stack_rows turns rows into grids. A
+directory left part way through a chunk by a crash is cut back to its last
+whole decision when it is next opened.
+"""
+
+import os
+from typing import BinaryIO
+
+import numpy as np
+
+from bitboard import BitBoard
+from client import TetrisClient
+from pieces import PIECE_IDS
+
+FEATURES = ("holes", "height", "wells", "score_delta")
+# name: dtype and the shape of a row, None being the board height
+DECISION_ARRAYS = {
+    "rows": (np.uint32, (None,)),
+    "pieces": (np.int8, (3,)),
+    "seeds": (np.int64, ()),
+    "first": (np.int64, ()),
+    "count": (np.int32, ()),
+    "chosen": (np.int32, ()),
+}
+CANDIDATE_ARRAYS = {"features": (np.int32, (len(FEATURES),))}
+# Headers are written at a fixed size so they can be rewritten in place as
+# the arrays grow
+HEADER_SIZE = 128
+
+
+class NpyAppender:
+    """
+    A .npy file opened for appending rows, with the shape in its header
+    kept up to date by flush().
+    """
+
+    def __init__(self, path: str, dtype, row_shape: tuple[int, ...]):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.row_bytes = self.dtype.itemsize * int(np.prod(row_shape))
+        self.length = 0
+        if os.path.exists(path):
+            self.file: BinaryIO = open(path, "r+b")
+            version = np.lib.format.read_magic(self.file)
+            shape, _, dtype = np.lib.format.read_array_header_1_0(self.file)
+            if (
+                version != (1, 0)
+                or self.file.tell() != HEADER_SIZE
+                or dtype != self.dtype
+            ):
+                raise ValueError(f"{path} was not written by dataset.py")
+            # rows missing from the end of the file, as if cut short, are dropped
+            written = (os.path.getsize(path) - HEADER_SIZE) // self.row_bytes
+            self.length = min(shape[0], written)
+        else:
+            self.file = open(path, "w+b")
+        self.write_header()
+
+    def write_header(self):
+        header = repr(
+            {
+                "descr": np.lib.format.dtype_to_descr(self.dtype),
+                "fortran_order": False,
+                "shape": (self.length, *self.row_shape),
+            }
+        )
+        # magic, version, header length, header, spaces and a newline
+        header = header.ljust(HEADER_SIZE - 10 - 1) + "\n"
+        self.file.seek(0)
+        self.file.write(np.lib.format.magic(1, 0))
+        self.file.write(len(header).to_bytes(2, "little"))
+        self.file.write(header.encode("latin1"))
+
+    def truncate(self, length: int):
+        """
+        Cut the array back to its first length rows.
+        """
+        self.length = length
+        self.file.truncate(HEADER_SIZE + length * self.row_bytes)
+        self.write_header()
+
+    def append(self, rows: np.ndarray):
+        self.file.seek(HEADER_SIZE + self.length * self.row_bytes)
+        self.file.write(np.ascontiguousarray(rows, dtype=self.dtype).tobytes())
+        self.length += len(rows)
+
+    def flush(self):
+        self.write_header()
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class DatasetWriter:
+    """
+    Buffers decision points and appends them to a dataset directory a chunk
+    at a time.
+    """
+
+    def __init__(self, directory: str, height: int = 20, chunk: int = 4096):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk = chunk
+        self.files = {}
+        for name, (dtype, row_shape) in {**DECISION_ARRAYS, **CANDIDATE_ARRAYS}.items():
+            row_shape = tuple(height if size is None else size for size in row_shape)
+            path = os.path.join(directory, f"{name}.npy")
+            self.files[name] = NpyAppender(path, dtype, row_shape)
+        self.repair()
+        self.buffers: dict[str, list] = {name: [] for name in self.files}
+        self.decisions = self.files["first"].length
+        self.candidates = self.files["features"].length
+
+    def repair(self):
+        """
+        Cut every file back to the decisions all the decision files hold,
+        and their candidates.
+        """
+        decisions = min(self.files[name].length for name in DECISION_ARRAYS)
+        candidates = 0
+        if decisions:
+            first = np.load(self.files["first"].path, mmap_mode="r")
+            count = np.load(self.files["count"].path, mmap_mode="r")
+            candidates = int(first[decisions - 1] + count[decisions - 1])
+        if candidates > self.files["features"].length:
+            # the last decision lost some of its candidates, so drop it too
+            decisions -= 1
+            candidates = int(first[decisions]) if decisions else 0
+        for name in DECISION_ARRAYS:
+            self.files[name].truncate(decisions)
+        for name in CANDIDATE_ARRAYS:
+            self.files[name].truncate(candidates)
+
+    def add(self, board, perms, chosen: int, seed: int):
+        """
+        Record a decision: the board before the move, its candidate
+        placements and the index of the one played.
+        """
+        # BitBoard.row_masks() is the live list of rows, so keep a copy
+        self.buffers["rows"].append(list(board.row_masks()))
+        self.buffers["pieces"].append(
+            (
+                PIECE_IDS[board.current_piece["name"]],
+                PIECE_IDS[board.next_piece["name"]],
+                PIECE_IDS[board.saved_piece["name"]] if board.saved_piece else -1,
+            )
+        )
+        self.buffers["seeds"].append(seed)
+        self.buffers["first"].append(self.candidates)
+        self.buffers["count"].append(len(perms))
+        self.buffers["chosen"].append(chosen)
+        for perm in perms:
+            candidate = perm["board"]
+            self.buffers["features"].append(
+                (
+                    candidate.count_holes(),
+                    candidate.get_height(),
+                    candidate.count_wells(),
+                    candidate.score - board.score,
+                )
+            )
+        self.decisions += 1
+        self.candidates += len(perms)
+        if len(self.buffers["first"]) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        # candidates go first, so a decision is only complete once its
+        # decision rows are written after them
+        for name in [*CANDIDATE_ARRAYS, *DECISION_ARRAYS]:
+            if self.buffers[name]:
+                self.files[name].append(np.array(self.buffers[name]))
+                self.buffers[name].clear()
+            self.files[name].flush()
+
+    def close(self):
+        self.flush()
+        for file in self.files.values():
+            file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def play(
+    writer: DatasetWriter,
+    seed: int,
+    max_pieces: int | None = None,
+    engine=BitBoard,
+    **client_args,
+):
+    """
+    Play one seeded game, recording every decision the client makes.
+    """
+    board = engine(seed=seed)
+    client = TetrisClient(board, **client_args)
+    while not board.defeated and (
+        max_pieces is None or board.total_pieces < max_pieces
+    ):
+        perms = client.find_permutations(board)
+        if not perms:
+            break
+        # choose() may reorder the list it is given
+        moves = client.choose(list(perms))
+        chosen = next(i for i, perm in enumerate(perms) if perm["moves"] == moves)
+        writer.add(board, perms, chosen, seed)
+        board.input(moves)
+
+
+def load(directory: str) -> dict[str, np.ndarray]:
+    """
+    Every array of a dataset, memory-mapped read only.
+    """
+    return {
+        name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        for name in {**DECISION_ARRAYS, **CANDIDATE_ARRAYS}
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from client import GENERATORS
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("directory", help="dataset directory, appended to if present")
+    parser.add_argument("--games", type=int, default=10, help="games to play")
+    parser.add_argument("--max-pieces", type=int, help="stop each game after this")
+    parser.add_argument("--generator", choices=GENERATORS, default="permutations")
+    args = parser.parse_args()
+
+    with DatasetWriter(args.directory) as writer:
+        # carry on from the seeds already played
+        start = 0
+        if writer.decisions:
+            start = int(np.load(writer.files["seeds"].path, mmap_mode="r")[-1]) + 1
+        began = time.perf_counter()
+        for seed in range(start, start + args.games):
+            play(writer, seed, args.max_pieces, generator=args.generator)
+            writer.flush()
+            print(
+                f"seed {seed}: {writer.decisions} decisions,"
+                f" {writer.candidates} candidates,"
+                f" {writer.decisions / (time.perf_counter() - began):.0f} decisions/s"
+            )
@@ -0,0 +1,272 @@
+"""
+A gym-style vectorized environment stepping many headless boards at once,
+for training learned evaluators.
+
+    env = VectorEnv(64, seed=0)
+    observations = env.reset()
+    observations, rewards, dones = env.step(actions)
+
+An action places the current piece: orientation * width + column, plus
+4 * width to place the piece HOLD would bring in instead. Orientations and
+columns past the piece's last wrap and clip, and a hold that is not
+available places the current piece, so every action in range(action_count)
+is valid. A placement the stack blocks above the spawn rows tops out, as it
+would in play. The reward is the score the placement made, and boards that
+top out are reset at once, their observation being the start of the next
+game.
+
+Observations are written into NumPy buffers allocated once and reused by
+every step, so hold on to a copy of anything needed after the next step:
+
+    grid      uint8 (envs, height, width)  locked blocks
+    pieces    int8  (envs, 3)              current, next and saved piece ids,
+                                           -1 when nothing is saved
+    features  int32 (envs, 3)              count_holes, get_height, count_wells
+
+With shared=True the buffers live in multiprocessing.shared_memory, and
+with workers the boards are split between that many processes which fill
+their slices of the buffers in place. Only a short command goes through a
+pipe each step; the actions are written into a shared buffer as well.
+"""
+
+from multiprocessing import Pipe, Process
+from multiprocessing.shared_memory import SharedMemory
+import random
+from typing import Sequence
+
+import numpy as np
+
+from bitboard import BitBoard
+from pieces import PIECE_IDS, piece_table
+
+
+def fields(envs: int, width: int, height: int) -> dict[str, tuple]:
+    """
+    Shape and dtype of every buffer.
+    """
+    return {
+        "grid": ((envs, height, width), np.uint8),
+        "pieces": ((envs, 3), np.int8),
+        "features": ((envs, 3), np.int32),
+        "rewards": ((envs,), np.float32),
+        "dones": ((envs,), np.bool_),
+        "actions": ((envs,), np.int32),
+    }
+
+
+def buffer_size(envs: int, width: int, height: int) -> int:
+    size = 0
+    for shape, dtype in fields(envs, width, height).values():
+        # keep every buffer 8 byte aligned
+        size += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 8) * 8
+    return size
+
+
+def buffers(envs: int, width: int, height: int, memory=None) -> dict[str, np.ndarray]:
+    """
+    The buffers, packed one after another into memory when given (anything
+    with the buffer protocol, such as SharedMemory.buf), or newly allocated.
+    """
+    if memory is None:
+        return {
+            name: np.zeros(shape, dtype)
+            for name, (shape, dtype) in fields(envs, width, height).items()
+        }
+    arrays = {}
+    offset = 0
+    for name, (shape, dtype) in fields(envs, width, height).items():
+        arrays[name] = np.ndarray(shape, dtype, buffer=memory, offset=offset)
+        offset += -(-arrays[name].nbytes // 8) * 8
+    return arrays
+
+
+def worker(connection, name: str, envs: int, start: int, stop: int, settings: dict):
+    """
+    Step boards start to stop - 1 of a VectorEnv, filling their slices of
+    its shared buffers, whenever the parent asks.
+    """
+    memory = SharedMemory(name=name)
+    arrays = buffers(envs, settings["width"], settings["height"], memory.buf)
+    env = VectorEnv(
+        stop - start,
+        arrays={name: array[start:stop] for name, array in arrays.items()},
+        **settings,
+    )
+    try:
+        while (command := connection.recv()) != "close":
+            if command == "reset":
+                env.reset()
+            else:
+                env.step(env.arrays["actions"])
+            connection.send(None)
+    finally:
+        # views into the shared memory must go before it can close
+        del env, arrays
+        memory.close()
+
+
+class VectorEnv:
+    """
+    N boards stepped together, with their observations in shared buffers.
+    """
+
+    def __init__(
+        self,
+        envs: int,
+        seed: int | None = None,
+        mode: str = "uniform",
+        width: int = 10,
+        height: int = 20,
+        engine=BitBoard,
+        shared: bool = False,
+        workers: int = 0,
+        arrays: dict[str, np.ndarray] | None = None,
+    ):
+        self.envs = envs
+        self.mode = mode
+        self.width = width
+        self.height = height
+        self.engine = engine
+        self.action_count = 8 * width
+        # every game gets the next seed from here, so a seeded run is repeatable
+        self.rng = random.Random(seed)
+        self.table = piece_table(width)
+        # each row bitmask's cells, for filling the grid a row at a time
+        self.row_cells = (
+            np.arange(1 << width)[:, None] >> np.arange(width) & 1
+        ).astype(np.uint8)
+        self.boards: list = []
+        self.memory: SharedMemory | None = None
+        if shared or workers:
+            self.memory = SharedMemory(
+                create=True, size=buffer_size(envs, width, height)
+            )
+            self.arrays = buffers(envs, width, height, self.memory.buf)
+        else:
+            self.arrays = arrays or buffers(envs, width, height)
+        self.observations = {
+            name: self.arrays[name] for name in ("grid", "pieces", "features")
+        }
+
+        self.workers: list[tuple[Process, object]] = []
+        for index in range(workers):
+            start = envs * index // workers
+            stop = envs * (index + 1) // workers
+            settings = {
+                "seed": self.rng.getrandbits(64) if seed is not None else None,
+                "mode": mode,
+                "width": width,
+                "height": height,
+                "engine": engine,
+            }
+            parent, child = Pipe()
+            process = Process(
+                target=worker,
+                args=(child, self.memory.name, envs, start, stop, settings),
+                daemon=True,
+            )
+            process.start()
+            self.workers.append((process, parent))
+
+    def new_game(self, index: int):
+        board = self.engine(
+            width=self.width,
+            height=self.height,
+            seed=self.rng.getrandbits(64),
+            mode=self.mode,
+        )
+        if index < len(self.boards):
+            self.boards[index] = board
+        else:
+            self.boards.append(board)
+
+    def observe(self, index: int):
+        board = self.boards[index]
+        np.take(
+            self.row_cells, board.row_masks(), axis=0, out=self.arrays["grid"][index]
+        )
+        pieces = self.arrays["pieces"][index]
+        pieces[0] = PIECE_IDS[board.current_piece["name"]]
+        pieces[1] = PIECE_IDS[board.next_piece["name"]]
+        pieces[2] = PIECE_IDS[board.saved_piece["name"]] if board.saved_piece else -1
+        features = self.arrays["features"][index]
+        features[0] = board.count_holes()
+        features[1] = board.get_height()
+        features[2] = board.count_wells()
+
+    def command(self, command: str):
+        for _, connection in self.workers:
+            connection.send(command)
+        for _, connection in self.workers:
+            connection.recv()
+
+    def reset(self) -> dict[str, np.ndarray]:
+        if self.workers:
+            self.command("reset")
+            return self.observations
+        for index in range(self.envs):
+            self.new_game(index)
+            self.observe(index)
+        self.arrays["rewards"][:] = 0
+        self.arrays["dones"][:] = False
+        return self.observations
+
+    def place(self, board, action: int):
+        """
+        Place the piece an action picks, clipped to where it can go.
+        """
+        hold, action = divmod(int(action) % self.action_count, 4 * self.width)
+        orientation, column = divmod(action, self.width)
+        piece = board.current_piece["name"]
+        if hold and not board.hold_used:
+            piece = (board.saved_piece or board.next_piece)["name"]
+        orientations = self.table[piece]
+        columns = orientations[orientation % len(orientations)]
+        board.place(
+            piece, orientation % len(orientations), min(column, len(columns) - 1)
+        )
+
+    def step(
+        self, actions: Sequence[int]
+    ) -> tuple[dict[str, np.ndarray], np.ndarray, np.ndarray]:
+        """
+        Place a piece on every board.
+        Returns the observations, rewards and dones, all reused buffers.
+        """
+        rewards = self.arrays["rewards"]
+        dones = self.arrays["dones"]
+        if self.workers:
+            self.arrays["actions"][:] = actions
+            self.command("step")
+            return self.observations, rewards, dones
+        for index, action in enumerate(actions):
+            board = self.boards[index]
+            score = board.score
+            try:
+                self.place(board, action)
+            except ValueError:
+                board.defeated = True
+            rewards[index] = board.score - score
+            dones[index] = board.defeated
+            if board.defeated:
+                self.new_game(index)
+            self.observe(index)
+        return self.observations, rewards, dones
+
+    def close(self):
+        if self.workers:
+            for process, connection in self.workers:
+                connection.send("close")
+                process.join()
+            self.workers = []
+        if self.memory is not None:
+            self.observations = self.arrays = {}
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,54 +1,140 @@
 # Best weights: [1.58865303 0.3142535  1.24303428 0.81636418]
 # Best score: 250132.4
 
+import json
+
+import numpy as np
 import pygad
-import random
 from client import TetrisClient
-from main import Board
+from bitboard import BitBoard
+from features import DEFAULT_FEATURES, FEATURES
+from fitness import FitnessCache, FitnessRunner, PositionFitness
+import stats
 
 
-def main():
-    bot = TetrisClient(Board())
-    while not bot.board.defeated:
+def main(
+    show_stats: bool = False, seed: int | None = None, max_pieces: int | None = None
+):
+    """
+    Play one game of the client with its default weights and print the score,
+    and with show_stats its per-game stats as JSON.
+    """
+    if show_stats:
+        stats.enable()
+        stats.STATS.reset()
+    bot = TetrisClient(BitBoard(seed=seed))
+    while not bot.board.defeated and (
+        max_pieces is None or bot.board.total_pieces < max_pieces
+    ):
         bot.move()
     print(bot.board.score)
+    if show_stats:
+        print(json.dumps(stats.STATS.as_dict()))
+        stats.disable()
 
 
-def fitness(weights, solution_idx):
-    seed = random.random()
-    random.seed(seed)
-    scores = []
-    for _ in range(15):
-        bot = TetrisClient(Board(), weights)
-        while not bot.board.defeated:
-            bot.move()
-        scores.append(bot.board.score)
-    print(
-        f"Solution {solution_idx}:\n Seed: {seed}\n Weights: {weights}\n Score: {sum(scores) / len(scores)}"
-    )
-    return sum(scores) / len(scores)
+# Every solution plays the same games, so differences in fitness come from the
+# weights rather than from the pieces dealt
+SEED = 0
+# Pieces each game is capped at, so every generation takes about as long
+MAX_PIECES = 2000
+
+# Weights the shared positions of --positions are played with
+REFERENCE_WEIGHTS = [1.58865303, 0.3142535, 1.24303428, 0.81636418]
+
+# Worker pool playing the fitness games, started by __main__
+runner: FitnessRunner | None = None
+# Shared positions scoring whole generations at once instead, with --positions
+estimate: PositionFitness | None = None
+
+
+def fitness(ga_instance, solutions, solution_indices):
+    """
+    Fitness of a batch of solutions, printed as each one's games finish.
+    """
+    if estimate is not None:
+        fitnesses = estimate.evaluate(solutions)
+        for index, value in enumerate(fitnesses):
+            print(
+                f"Solution {solution_indices[index]}:\n Weights: {solutions[index]}\n Estimate: {value}"
+            )
+        return fitnesses
+    fitnesses = np.zeros(len(solutions))
+    for index, value in runner.stream(solutions):
+        fitnesses[index] = value
+        print(
+            f"Solution {solution_indices[index]}:\n Seed: {SEED}\n Weights: {solutions[index]}\n Score: {value}"
+        )
+    return fitnesses
 
 
 def on_generation(ga: pygad.GA):
-    print(
-        f"\nGeneration complete.\nBest weights: {ga.best_solution()[0]}\nBest score: {ga.best_solution()[1]}\n"
-    )
+    best = ga.best_solution(ga.last_generation_fitness)
+    print(f"\nGeneration complete.\nBest weights: {best[0]}\nBest score: {best[1]}\n")
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Evolve the client's weights.")
+    parser.add_argument(
+        "--positions",
+        type=int,
+        help="score solutions on this many shared positions instead of games",
+    )
+    parser.add_argument(
+        "--features",
+        nargs="+",
+        choices=FEATURES,
+        help="evolve weights for these features instead of holes, height and wells",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="play one instrumented client game on the fitness seed and print its"
+        " stats instead of evolving; the GA's own games run on BatchSimulator,"
+        " which is not instrumented",
+    )
+    args = parser.parse_args()
+    if args.positions and args.features:
+        parser.error("--positions only scores the default features")
+    if args.stats:
+        main(show_stats=True, seed=SEED, max_pieces=MAX_PIECES)
+        raise SystemExit
+
+    if args.positions:
+        estimate = PositionFitness(
+            REFERENCE_WEIGHTS, positions=args.positions, seed=SEED
+        )
+    else:
+        # Fitnesses are saved as they come in. The GA is seeded too, so
+        # rerunning after a crash replays the finished generations from the
+        # cache.
+        runner = FitnessRunner(
+            processes=15,
+            games=15,
+            seed=SEED,
+            max_pieces=MAX_PIECES,
+            cache=FitnessCache("fitness_cache.sqlite"),
+            features=args.features,
+        )
     ga = pygad.GA(
         fitness_func=fitness,
         num_generations=40,
         num_parents_mating=3,
         on_generation=on_generation,
         sol_per_pop=15,
-        num_genes=4,
+        # a weight for the score, then one per feature
+        num_genes=1 + len(args.features or DEFAULT_FEATURES),
         mutation_num_genes=2,
         init_range_low=0.5,
         init_range_high=1.5,
-        parallel_processing=["process", 15],
+        fitness_batch_size=15,
         save_best_solutions=True,
+        random_seed=SEED,
     )
     ga.run()
+    if runner:
+        runner.close()
     ga.plot_fitness()
-    print("\nBest solution: ", ga.best_solution())
+    print("\nBest solution: ", ga.best_solution(ga.last_generation_fitness))
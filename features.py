@@ -0,0 +1,238 @@
+"""
+Board features for evaluating placements, any set of them at once.
+
+    holes               empty cells directly under a block
+    height              rows holding a block
+    wells               empty cells from the fifth row down with a block
+                        below, two empty cells above and blocks or walls
+                        either side of those two
+    bumpiness           summed height differences of neighbouring columns
+    row_transitions     filled cells next to empty ones along the rows
+                        holding a block, the walls counting as filled
+    column_transitions  filled cells above or below empty ones down the
+                        columns, the floor counting as filled
+    landing_height      rows under the bottom of the last piece locked
+    eroded_cells        the last piece's cells in the lines it completed,
+                        times the number of those lines
+
+extract() reads a board's features from what the engines keep up to date as
+pieces lock: the hole, height and well counts, the column heights and the
+last lock. Only the transitions need the rows, and those come from scan(),
+which finds every feature of bare row bitmasks in a single pass over them.
+from_rows() is the vectorised equivalent for stacks of boards.
+
+An evaluation with a set of features has one weight for the score and one
+for each feature, in the same form as TetrisClient's default evaluation:
+
+    score * w0 * (eroded_cells * w + 1) / (holes * w + 1) / (height * w + 1) ...
+
+eroded_cells being the only feature that raises it. As there, the first
+well is free, so the features holes, height and wells give the default
+evaluation.
+"""
+
+from typing import Sequence
+
+import numpy as np
+
+import batch
+
+FEATURES = (
+    "holes",
+    "height",
+    "wells",
+    "bumpiness",
+    "row_transitions",
+    "column_transitions",
+    "landing_height",
+    "eroded_cells",
+)
+# Features the evaluation is multiplied by rather than divided by
+REWARDS = ("eroded_cells",)
+# The features of TetrisClient's default evaluation
+DEFAULT_FEATURES = ("holes", "height", "wells")
+
+
+def check(names: Sequence[str], weights: Sequence[float] | None = None):
+    """
+    Raise ValueError for unknown features, or weights not one for the score
+    followed by one per feature.
+    """
+    unknown = [name for name in names if name not in FEATURES]
+    if unknown:
+        raise ValueError(f"Unknown features {unknown}, expected some of {FEATURES}")
+    if weights is not None and len(weights) != len(names) + 1:
+        raise ValueError(
+            f"{len(names)} features need {len(names) + 1} weights, got {len(weights)}"
+        )
+
+
+def scan(rows: Sequence[int], width: int) -> dict[str, int]:
+    """
+    Every feature of the blocks in rows, bitmasks with bit c being column c,
+    in one pass down them. landing_height and eroded_cells are left out, as
+    they come from the last lock rather than the blocks.
+    """
+    full = (1 << width) - 1
+    walls = 1 | 1 << (width + 1)
+    inside = (1 << (width + 1)) - 1
+    # masks of columns whose left/right neighbour is filled or a wall
+    left_wall = 1
+    right_wall = 1 << (width - 1)
+    heights = [0] * width
+    remaining = full
+    holes = height = wells = row_transitions = column_transitions = 0
+    # the three rows above the current one
+    above = above2 = above3 = 0
+    for rownum, row in enumerate(rows):
+        if row:
+            height += 1
+            walled = row << 1 | walls
+            row_transitions += ((walled ^ walled >> 1) & inside).bit_count()
+        column_transitions += (row ^ above).bit_count()
+        holes += (above & ~row).bit_count()
+        # the row above is a well's row once the row under it is known
+        if rownum > 4:
+            wells += (
+                ~above
+                & row
+                & ~above2
+                & ((above2 << 1) | left_wall)
+                & ((above2 >> 1) | right_wall)
+                & ~above3
+                & ((above3 << 1) | left_wall)
+                & ((above3 >> 1) | right_wall)
+                & full
+            ).bit_count()
+        found = row & remaining
+        while found:
+            col = (found & -found).bit_length() - 1
+            heights[col] = len(rows) - rownum
+            found &= found - 1
+        remaining &= ~row
+        above, above2, above3 = row, above, above2
+    # the floor, under the bottom row
+    column_transitions += (full & ~above).bit_count()
+    if len(rows) > 4:
+        wells += (
+            ~above
+            & ~above2
+            & ((above2 << 1) | left_wall)
+            & ((above2 >> 1) | right_wall)
+            & ~above3
+            & ((above3 << 1) | left_wall)
+            & ((above3 >> 1) | right_wall)
+            & full
+        ).bit_count()
+    return {
+        "holes": holes,
+        "height": height,
+        "wells": wells,
+        "bumpiness": sum(abs(a - b) for a, b in zip(heights, heights[1:])),
+        "row_transitions": row_transitions,
+        "column_transitions": column_transitions,
+    }
+
+
+def extract(board, names: Sequence[str] = FEATURES) -> list[int]:
+    """
+    The named features of a board after a move, in order.
+    """
+    values = {}
+    if "row_transitions" in names or "column_transitions" in names:
+        values = scan(board.row_masks(), board.width)
+    features = []
+    for name in names:
+        if name == "holes":
+            features.append(board.count_holes())
+        elif name == "height":
+            features.append(board.get_height())
+        elif name == "wells":
+            features.append(board.count_wells())
+        elif name == "bumpiness":
+            heights = board.column_heights()
+            features.append(sum(abs(a - b) for a, b in zip(heights, heights[1:])))
+        elif name == "landing_height":
+            features.append(board.landing_height)
+        elif name == "eroded_cells":
+            features.append(board.eroded_cells)
+        else:
+            features.append(values[name])
+    return features
+
+
+def from_rows(
+    rows: np.ndarray,
+    width: int,
+    names: Sequence[str] = FEATURES,
+    landing_height: np.ndarray | None = None,
+    eroded_cells: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    The named features of boards given as row bitmasks of shape (..., height),
+    stacked on a last axis. landing_height and eroded_cells are passed in,
+    with the shape of rows less its last axis.
+    """
+    given = {"landing_height": landing_height, "eroded_cells": eroded_cells}
+    vectorised = {
+        "holes": batch.holes_from_rows,
+        "height": lambda rows, width: batch.height_from_rows(rows),
+        "wells": batch.wells_from_rows,
+        "bumpiness": batch.bumpiness_from_rows,
+        "row_transitions": batch.row_transitions_from_rows,
+        "column_transitions": batch.column_transitions_from_rows,
+    }
+    return np.stack(
+        [
+            given[name] if name in given else vectorised[name](rows, width)
+            for name in names
+        ],
+        axis=-1,
+    )
+
+
+def evaluate(
+    weights: Sequence[float],
+    names: Sequence[str],
+    score: int,
+    features: Sequence[int],
+    defeated: bool,
+) -> float:
+    """
+    Evaluation of a board from its score and the named features, higher
+    being better.
+    """
+    if defeated:
+        return 0
+    value = score * weights[0]
+    for name, feature, weight in zip(names, features, weights[1:]):
+        if name == "wells":
+            feature = max(feature, 1) - 1
+        if name in REWARDS:
+            value *= (feature * weight) + 1
+        else:
+            value /= (feature * weight) + 1
+    return value
+
+
+def evaluate_many(
+    weights: Sequence[float],
+    names: Sequence[str],
+    scores: np.ndarray,
+    features: np.ndarray,
+    defeated: np.ndarray,
+) -> np.ndarray:
+    """
+    evaluate() for arrays of boards, with their features stacked on a last
+    axis as from_rows() gives them.
+    """
+    value = ~defeated * (scores * weights[0])
+    for index, name in enumerate(names):
+        feature = features[..., index]
+        if name == "wells":
+            feature = np.maximum(feature, 1) - 1
+        if name in REWARDS:
+            value = value * ((feature * weights[index + 1]) + 1)
+        else:
+            value = value / ((feature * weights[index + 1]) + 1)
+    return value
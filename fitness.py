@@ -0,0 +1,355 @@
+"""
+Fitness evaluation for evo.py on a pool of long-lived worker processes.
+
+Each worker builds the simulator's tables once when it starts and then
+plays whatever weights it is sent. Every solution's games are split into
+small chunks so all the cores stay busy until the end of a generation,
+and each game stops after max_pieces so no solution can run on for
+minutes. Fitnesses are yielded as soon as each solution's games finish.
+
+A FitnessCache keeps every fitness on disk, so solutions carried into
+later generations are not played again, and a crashed run restarted with
+the same GA seed replays the finished generations from the cache.
+
+PositionFitness is a much cheaper estimate: a fixed set of positions is
+played out once up front, and after that a whole population is scored by
+the placements it would choose there, in one vectorized pass.
+"""
+
+import json
+from multiprocessing import Pool
+import sqlite3
+from typing import Iterator, Sequence
+
+import numpy as np
+
+import batch
+import features as features_module
+from simulator import ENGINE_VERSION, BatchSimulator, simulator_tables
+
+# How a solution's games are turned into its fitness: the mean final score,
+# or the score made per piece placed
+METRICS = ("score", "rate")
+
+
+def init_worker(width: int):
+    simulator_tables(width)
+
+
+def play(task) -> tuple[int, int, int]:
+    """
+    Play one chunk of a solution's games.
+    Returns the solution index, the total score and the pieces placed.
+    """
+    solution, weights, seed, games, max_pieces, mode, width, features = task
+    simulator = BatchSimulator(
+        weights, games=games, seed=seed, width=width, mode=mode, features=features
+    )
+    simulator.run(max_pieces=max_pieces)
+    return solution, int(simulator.score.sum()), int(simulator.total_pieces.sum())
+
+
+class FitnessCache:
+    """
+    Fitnesses already played, in an SQLite file keyed by the rounded weights
+    and the settings of the games. Once there are more than max_entries the
+    least recently used are dropped.
+    """
+
+    def __init__(
+        self,
+        path: str = "fitness_cache.sqlite",
+        max_entries: int = 100_000,
+        digits: int = 8,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.digits = digits
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS fitness"
+            " (key TEXT PRIMARY KEY, fitness REAL, used INTEGER)"
+        )
+        # counter ordering the entries by when they were last used
+        self.clock = self.db.execute(
+            "SELECT COALESCE(MAX(used), 0) FROM fitness"
+        ).fetchone()[0]
+
+    def key(self, weights: Sequence[float], settings: Sequence) -> str:
+        return json.dumps(
+            [[round(float(weight), self.digits) for weight in weights], list(settings)]
+        )
+
+    def get(self, key: str) -> float | None:
+        row = self.db.execute(
+            "SELECT fitness FROM fitness WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.clock += 1
+        self.db.execute("UPDATE fitness SET used = ? WHERE key = ?", (self.clock, key))
+        self.db.commit()
+        return row[0]
+
+    def put(self, key: str, fitness: float):
+        self.clock += 1
+        self.db.execute(
+            "INSERT OR REPLACE INTO fitness VALUES (?, ?, ?)",
+            (key, fitness, self.clock),
+        )
+        self.db.execute(
+            "DELETE FROM fitness WHERE key IN (SELECT key FROM fitness"
+            " ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self.db.commit()
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM fitness").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+
+class FitnessRunner:
+    """
+    Plays games for a population of weights on a persistent process pool.
+    Every solution plays the same seeded games, so fitnesses within and
+    between generations are directly comparable.
+    """
+
+    def __init__(
+        self,
+        processes: int | None = None,
+        games: int = 15,
+        chunk: int = 5,
+        seed: int = 0,
+        max_pieces: int | None = 2000,
+        metric: str = "score",
+        mode: str = "uniform",
+        width: int = 10,
+        cache: FitnessCache | None = None,
+        features: Sequence[str] | None = None,
+    ):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric}, expected one of {METRICS}")
+        if features is not None:
+            features_module.check(features)
+        self.games = games
+        self.chunk = chunk
+        self.seed = seed
+        self.max_pieces = max_pieces
+        self.metric = metric
+        self.mode = mode
+        self.width = width
+        self.cache = cache
+        # features.py features the solutions' weights are for, if not the
+        # default evaluation's
+        self.features = features
+        self.pool = Pool(processes, initializer=init_worker, initargs=(width,))
+
+    def settings(self) -> tuple:
+        """
+        Everything besides the weights that decides a solution's fitness.
+        """
+        settings = (
+            ENGINE_VERSION,
+            self.seed,
+            self.games,
+            self.chunk,
+            self.max_pieces,
+            self.metric,
+            self.mode,
+            self.width,
+        )
+        # added only when set, so fitnesses cached before features keep their keys
+        if self.features is not None:
+            settings += (list(self.features),)
+        return settings
+
+    def tasks(self, population: Sequence[Sequence[float]], solutions: list[int]):
+        for solution in solutions:
+            weights = population[solution]
+            for start in range(0, self.games, self.chunk):
+                games = min(self.chunk, self.games - start)
+                seed = [self.seed, start]
+                yield (
+                    solution,
+                    list(weights),
+                    seed,
+                    games,
+                    self.max_pieces,
+                    self.mode,
+                    self.width,
+                    self.features,
+                )
+
+    def stream(
+        self, population: Sequence[Sequence[float]]
+    ) -> Iterator[tuple[int, float]]:
+        """
+        Yield (solution index, fitness) for each solution as its games finish.
+        """
+        keys = [""] * len(population)
+        solutions = []
+        for solution, weights in enumerate(population):
+            fitness = None
+            if self.cache is not None:
+                keys[solution] = self.cache.key(weights, self.settings())
+                fitness = self.cache.get(keys[solution])
+            if fitness is None:
+                solutions.append(solution)
+            else:
+                yield solution, fitness
+
+        chunks = -(-self.games // self.chunk)
+        remaining = [chunks] * len(population)
+        scores = [0] * len(population)
+        pieces = [0] * len(population)
+        for solution, score, placed in self.pool.imap_unordered(
+            play, self.tasks(population, solutions)
+        ):
+            scores[solution] += score
+            pieces[solution] += placed
+            remaining[solution] -= 1
+            if not remaining[solution]:
+                if self.metric == "rate":
+                    fitness = scores[solution] / max(pieces[solution], 1)
+                else:
+                    fitness = scores[solution] / self.games
+                if self.cache is not None:
+                    self.cache.put(keys[solution], fitness)
+                yield solution, fitness
+
+    def evaluate(self, population: Sequence[Sequence[float]]) -> np.ndarray:
+        """
+        Fitness of every solution, in population order.
+        """
+        fitnesses = np.zeros(len(population))
+        for solution, fitness in self.stream(population):
+            fitnesses[solution] = fitness
+        return fitnesses
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PositionFitness:
+    """
+    Fitness estimated from the same positions for every solution. Positions
+    are sampled every few pieces from seeded games played with reference
+    weights, and each candidate placement at them is valued once by
+    playing on from it for horizon pieces with those weights, all the
+    candidates at a position getting the same pieces, and evaluating the
+    board it ends on. A solution's fitness is the mean value of the
+    candidates its evaluation picks, found for the whole population with one
+    broadcast.
+
+    Most positions have one clearly best placement, so solutions only
+    disagree at a few of them and the estimate is rough: it ranks weights
+    far apart well but is no substitute for playing games to separate
+    close ones. The rollouts take a minute or so up front.
+    """
+
+    def __init__(
+        self,
+        weights: Sequence[float],
+        positions: int = 1024,
+        games: int = 32,
+        every: int = 3,
+        horizon: int = 20,
+        seed: int = 0,
+        mode: str = "uniform",
+        width: int = 10,
+        chunk: int = 1024,
+    ):
+        simulator = BatchSimulator(
+            weights, games=games, seed=[seed, 0], width=width, mode=mode
+        )
+        sampled = []
+        count = 0
+        while count < positions and simulator.alive.any():
+            if simulator.total_pieces.max() % every == 0:
+                games_alive = np.flatnonzero(simulator.alive)[: positions - count]
+                found = simulator.candidates(games_alive)
+                found["base"] = simulator.score[games_alive]
+                current = simulator.current_piece[games_alive][:, None]
+                saved = simulator.saved_piece[games_alive][:, None]
+                found["saved"] = np.where(found["hold"], current, saved)
+                sampled.append(found)
+                count += len(games_alive)
+            simulator.step()
+        features = {
+            name: np.concatenate([found[name] for found in sampled])
+            for name in sampled[0]
+        }
+        self.scores = features["scores"]
+        self.holes = features["holes"]
+        self.height = features["height"]
+        self.wells = features["wells"]
+        self.defeated = features["defeated"]
+        self.valid = features["valid"]
+
+        # play every valid candidate on for horizon pieces, a chunk at a time
+        gained = self.scores - features["base"][:, None]
+        rollout = np.zeros(self.scores.shape)
+        starts = np.argwhere(self.valid & ~self.defeated)
+        # every candidate at a position is played on with the same pieces, so
+        # the luck of the draw cancels out when they are compared
+        future = BatchSimulator(
+            weights, games=len(self.scores), seed=[seed, 1], width=width, mode=mode
+        ).sequence
+        for first in range(0, len(starts), chunk):
+            index = tuple(starts[first : first + chunk].T)
+            simulator = BatchSimulator(
+                weights,
+                games=len(index[0]),
+                seed=[seed, 1, first],
+                width=width,
+                mode=mode,
+            )
+            simulator.rows[:] = features["rows"][index]
+            simulator.difficult_combo[:] = features["combo"][index]
+            simulator.current_piece[:] = features["spawned"][index]
+            simulator.saved_piece[:] = features["saved"][index]
+            simulator.sequence = future[index[0]]
+            simulator.drawn[:] = 0
+            simulator.next_piece[:] = simulator.draw(np.arange(len(index[0])))
+            simulator.run(max_pieces=horizon)
+            # the board the rollout ends on, valued as the reference weights
+            # would value it, so damage not yet paid for still counts
+            rollout[index] = batch.evaluate(
+                weights,
+                gained[index] + simulator.score,
+                batch.holes_from_rows(simulator.rows, width),
+                batch.height_from_rows(simulator.rows),
+                batch.wells_from_rows(simulator.rows, width),
+                ~simulator.alive & (simulator.total_pieces < horizon),
+            )
+        self.values = rollout
+
+    def evaluate(self, population: Sequence[Sequence[float]]) -> np.ndarray:
+        """
+        Fitness of every solution, in population order.
+        """
+        evaluation = batch.evaluate(
+            np.asarray(population, dtype=float),
+            self.scores,
+            self.holes,
+            self.height,
+            self.wells,
+            self.defeated,
+        )
+        evaluation = np.where(self.valid, evaluation, -np.inf)
+        chosen = evaluation.argmax(axis=2)
+        values = np.take_along_axis(self.values[None], chosen[..., None], axis=2)
+        return values[..., 0].mean(axis=1)
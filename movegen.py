@@ -0,0 +1,245 @@
+"""
+Move generation by breadth-first search over every position the active piece
+can reach.
+
+A position is the (orientation, column, row) of the top left of the piece's
+bounding box, as in the piece table. From each position the piece can move
+LEFT or RIGHT, turn with ROT_ANTICLOCKWISE or ROT_CLOCKWISE following the
+engines' rotate(), or soft drop a row with GRAVITY, so placements that need a
+soft drop followed by a slide or a turn under an overhang are found too.
+
+The search runs a layer of key presses at a time with every position held
+as one bit of a single int, so a whole layer moves with a few shifts and
+masks per key. Every distinct place the piece can lock is returned once,
+with a shortest key sequence ending in HARDDROP.
+"""
+
+from pieces import SPAWN_OFFSETS, piece_table
+
+KEYS = ("LEFT", "RIGHT", "ROT_ANTICLOCKWISE", "ROT_CLOCKWISE", "GRAVITY")
+
+
+def column_masks(rows: list[int], width: int) -> list[int]:
+    """
+    Locked blocks of each column as a bitmask, bit r being row r.
+    """
+    columns = [0] * width
+    for rownum, row in enumerate(rows):
+        while row:
+            col = (row & -row).bit_length() - 1
+            columns[col] |= 1 << rownum
+            row &= row - 1
+    return columns
+
+
+def free_rows(name: str, columns: list[int], width: int, height: int):
+    """
+    Rows each placement of a piece fits at, as bitmasks indexed by
+    [orientation][column].
+    """
+    free = []
+    for placements in piece_table(width)[name]:
+        by_column = []
+        for placement in placements:
+            blocked = 0
+            for rowoffset, col in placement.cells:
+                blocked |= columns[col] >> rowoffset
+            inside = (1 << (height - placement.height + 1)) - 1
+            by_column.append(inside & ~blocked)
+        free.append(by_column)
+    return free
+
+
+class Layout:
+    """
+    Every (orientation, column, row) position of a piece as one bit of an
+    int, at ((orientation * width) + column) * stride + row, so a key press
+    moves a whole set of positions with a shift and a mask. Columns a
+    placement does not have are never free.
+    """
+
+    def __init__(self, free: list[list[int]], width: int, height: int):
+        self.orientations = len(free)
+        self.width = width
+        # a spare row per column, so GRAVITY never carries a position into
+        # the next column
+        self.stride = height + 1
+        self.span = width * self.stride
+        self.free = 0
+        for o, by_column in enumerate(free):
+            for c, bits in enumerate(by_column):
+                self.free |= bits << self.bit(o, c, 0)
+        column = (1 << self.stride) - 1
+        self.first_column = 0
+        self.last_column = 0
+        for o in range(self.orientations):
+            self.first_column |= column << self.bit(o, 0, 0)
+            self.last_column |= column << self.bit(o, width - 1, 0)
+        self.last_orientation = ((1 << self.span) - 1) << self.bit(
+            self.orientations - 1, 0, 0
+        )
+
+    def bit(self, orientation: int, column: int, row: int) -> int:
+        return (orientation * self.width + column) * self.stride + row
+
+    def position(self, bit: int) -> tuple[int, int, int]:
+        orientation, rest = divmod(bit, self.span)
+        return (orientation, *divmod(rest, self.stride))
+
+    def turned(self, positions: int) -> int:
+        """
+        The positions one orientation on, wrapping round to the first.
+        """
+        last = positions & self.last_orientation
+        return ((positions ^ last) << self.span) | (
+            last >> (self.orientations - 1) * self.span
+        )
+
+    def turned_back(self, positions: int) -> int:
+        """
+        The positions one orientation back, wrapping round to the last.
+        """
+        first = positions & (1 << self.span) - 1
+        return ((positions ^ first) >> self.span) | (
+            first << (self.orientations - 1) * self.span
+        )
+
+    def move(self, positions: int, key: str) -> int:
+        """
+        Where positions end up after key, following the engines' input().
+        Positions that cannot move stay where they are.
+        """
+        if key == "LEFT":
+            moved = (positions & ~self.first_column) >> self.stride & self.free
+            return moved | positions & ~(moved << self.stride)
+        if key == "RIGHT":
+            moved = (positions & ~self.last_column) << self.stride & self.free
+            return moved | positions & ~(moved >> self.stride)
+        if key == "GRAVITY":
+            moved = positions << 1 & self.free
+            return moved | positions & ~(moved >> 1)
+        # rotate() makes each anticlockwise turn only if the piece fits, and
+        # a clockwise rotation is three of them
+        for _ in range(1 if key == "ROT_ANTICLOCKWISE" else 3):
+            moved = self.turned(positions) & self.free
+            positions = moved | positions & ~self.turned_back(moved)
+        return positions
+
+    def sources(self, bit: int, key: str) -> list[int]:
+        """
+        Positions that could reach bit with key.
+        """
+        if key == "LEFT":
+            candidates = [bit + self.stride]
+        elif key == "RIGHT":
+            candidates = [bit - self.stride]
+        elif key == "GRAVITY":
+            candidates = [bit - 1]
+        else:
+            orientation, column, row = self.position(bit)
+            candidates = [
+                self.bit(o, column, row)
+                for o in range(self.orientations)
+                if o != orientation
+            ]
+        return [
+            source
+            for source in candidates
+            if 0 <= source and self.move(1 << source, key) >> bit & 1
+        ]
+
+
+def search(layout: Layout, start: tuple[int, int, int]) -> dict[tuple, list[str]]:
+    """
+    Every lock position reachable from start, with a shortest key sequence.
+    Returns {(orientation, column, row): keys}, the keys ending in HARDDROP
+    and row being where the piece locks.
+    """
+    # each run of free rows locks at its lowest row
+    runs = []
+    free = layout.free
+    while free:
+        top = free & -free
+        run = free & ~(free + top)
+        runs.append(run)
+        free &= ~run
+
+    layers = [1 << layout.bit(*start)]
+    visited = layers[0]
+    found = {}
+    while layers[-1]:
+        positions = layers[-1]
+        for run in runs:
+            if run & positions:
+                # the highest position in the run, for the most drop points
+                highest = (run & positions & -(run & positions)).bit_length() - 1
+                found[layout.position(run.bit_length() - 1)] = (
+                    len(layers) - 1,
+                    highest,
+                )
+        runs = [run for run in runs if not run & positions]
+        layer = 0
+        for key in KEYS:
+            layer |= layout.move(positions, key)
+        layer &= ~visited
+        visited |= layer
+        layers.append(layer)
+
+    return {
+        position: path(layout, layers, highest, depth) + ["HARDDROP"]
+        for position, (depth, highest) in found.items()
+    }
+
+
+def path(layout: Layout, layers: list[int], bit: int, depth: int) -> list[str]:
+    """
+    Keys leading from the start to a position first reached at layer depth.
+    """
+    keys = []
+    for previous in reversed(layers[:depth]):
+        key, bit = next(
+            (key, source)
+            for key in KEYS
+            for source in layout.sources(bit, key)
+            if previous >> source & 1
+        )
+        keys.append(key)
+    return keys[::-1]
+
+
+def find_placements(board, hold: bool = True):
+    """
+    Every distinct placement of the current piece and, when hold is
+    available, of the piece HOLD brings in, as {"board", "moves"} dicts like
+    TetrisClient.find_permutations. Each resulting board is made with one
+    copy and place().
+    """
+    position = board.position()
+    if position is None:
+        return []
+    columns = column_masks(board.row_masks(), board.width)
+    starts = [([], board.current_piece, position)]
+    if hold and not board.hold_used:
+        held = board.saved_piece or board.next_piece
+        rowoffset, coloffset = SPAWN_OFFSETS[held["name"]]
+        starts.append(
+            (["HOLD"], held, (0, coloffset + int(board.width / 2) - 1, rowoffset))
+        )
+
+    permutations = []
+    for prefix, piece, start in starts:
+        free = free_rows(piece["name"], columns, board.width, board.height)
+        if not free[start[0]][start[1]] >> start[2] & 1:
+            continue
+        layout = Layout(free, board.width, board.height)
+        for (orientation, column, row), keys in search(layout, start).items():
+            temp_board = board.copy()
+            if prefix:
+                temp_board.input(prefix, update=False)
+            temp_board.place(piece["name"], orientation, column, row=row)
+            # place() scores a hard drop from the start; the keys may soft drop
+            # first, which scores 2 points fewer per row
+            drops = keys.count("GRAVITY")
+            temp_board.score -= 2 * drops
+            permutations.append({"board": temp_board, "moves": prefix + keys})
+    return permutations
@@ -0,0 +1,260 @@
+"""
+Piece definitions shared by the board engines.
+
+Colours are stored as colour names so the definitions can be used without
+pygame; pg.Color accepts them directly when rendering.
+
+The rotation and placement tables below are built once at import so the
+engines never have to work out piece geometry while playing.
+"""
+
+from functools import cache
+import random
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Sequence
+
+PIECES = {
+    "I": {
+        "name": "I",
+        "symmetery": 2,
+        "shape": ((0, 1, 0), (0, 1, 0), (0, 1, 0), (0, 1, 0)),
+        "colour": "cyan",
+    },
+    "L": {
+        "name": "L",
+        "symmetery": 4,
+        "shape": ((0, 1, 0), (0, 1, 0), (0, 1, 1)),
+        "colour": "orange",
+    },
+    "R": {
+        "name": "R",
+        "symmetery": 4,
+        "shape": ((0, 1, 1), (0, 1, 0), (0, 1, 0)),
+        "colour": "blue",
+    },
+    "T": {
+        "name": "T",
+        "symmetery": 4,
+        "shape": ((0, 1, 0), (1, 1, 1)),
+        "colour": "purple",
+    },
+    "Z": {
+        "name": "Z",
+        "symmetery": 2,
+        "shape": ((1, 1, 0), (0, 1, 1)),
+        "colour": "red",
+    },
+    "S": {
+        "name": "S",
+        "symmetery": 2,
+        "shape": ((0, 1, 1), (1, 1, 0)),
+        "colour": "green",
+    },
+    "O": {
+        "name": "O",
+        "symmetery": 1,
+        "shape": ((1, 1, 0), (1, 1, 0)),
+        "colour": "yellow",
+    },
+}
+
+# PIECES = {
+#     "DOT": {
+#         "name": "DOT",
+#         "symmetery": 2,
+#         "shape": ((0, 1, 0), (0, 1, 0), (0, 1, 0)),
+#         "colour": "cyan",
+#     },
+#     "ARCH": {
+#         "name": "ARCH",
+#         "symmetery": 4,
+#         "shape": ((0, 1, 1), (0, 1, 0), (0, 1, 1)),
+#         "colour": "orange",
+#     },
+#     "BITS": {
+#         "name": "BITS",
+#         "symmetery": 4,
+#         "shape": ((1, 0, 0), (1, 0, 1), (0, 0, 1)),
+#         "colour": "purple",
+#     },
+# }
+
+# The definitions are shared by every board and sequence, so they are read
+# only, down to the shapes
+PIECES = MappingProxyType(
+    {name: MappingProxyType(piece) for name, piece in PIECES.items()}
+)
+
+# Pieces in a fixed order, and the id of each, as replays, environment
+# observations, datasets and the simulator number them
+PIECE_NAMES = list(PIECES)
+PIECE_IDS = {name: index for index, name in enumerate(PIECE_NAMES)}
+
+
+class Placement(NamedTuple):
+    """
+    One orientation of a piece with the left of its bounding box at a given
+    board column. Row offsets are relative to the top of the bounding box.
+    """
+
+    name: str
+    orientation: int
+    column: int
+    width: int
+    height: int
+    # (row offset, board column) of every block
+    cells: tuple[tuple[int, int], ...]
+    # bitmask of each row of the bounding box, already shifted to the column
+    masks: tuple[int, ...]
+    # lowest row offset of the piece in each board column it covers
+    bottom: tuple[int, ...]
+
+
+def shape_cells(shape: Sequence[Sequence[int]]) -> tuple[tuple[int, int], ...]:
+    """
+    Cells of a shape grid relative to the top left of their bounding box.
+    """
+    cells = [
+        (rownum, colnum)
+        for rownum, row in enumerate(shape)
+        for colnum, cell in enumerate(row)
+        if cell
+    ]
+    rowoffset = min(cell[0] for cell in cells)
+    coloffset = min(cell[1] for cell in cells)
+    return tuple(sorted((row - rowoffset, col - coloffset) for row, col in cells))
+
+
+def rotate_cells(cells: tuple[tuple[int, int], ...]) -> tuple[tuple[int, int], ...]:
+    """
+    Rotate cells anticlockwise about the top left of their bounding box,
+    the same turn Board.rotate makes for one step.
+    """
+    colwidth = max(cell[1] for cell in cells) + 1
+    return tuple(sorted((colwidth - 1 - col, row) for row, col in cells))
+
+
+# Distinct orientations of every piece, index 0 being the spawn orientation and
+# each following index one more anticlockwise turn
+ORIENTATIONS: dict[str, tuple[tuple[tuple[int, int], ...], ...]] = {}
+# Offset of the spawn orientation's bounding box within the piece's shape grid
+SPAWN_OFFSETS: dict[str, tuple[int, int]] = {}
+for _name, _piece in PIECES.items():
+    _orientations = [shape_cells(_piece["shape"])]
+    for _ in range(_piece["symmetery"] - 1):
+        _orientations.append(rotate_cells(_orientations[-1]))
+    ORIENTATIONS[_name] = tuple(_orientations)
+    SPAWN_OFFSETS[_name] = (
+        min(rownum for rownum, row in enumerate(_piece["shape"]) if any(row)),
+        min(
+            colnum for row in _piece["shape"] for colnum, cell in enumerate(row) if cell
+        ),
+    )
+
+
+@cache
+def piece_table(width: int = 10) -> dict[str, tuple[tuple[Placement, ...], ...]]:
+    """
+    Every placement of every piece on a board of the given width, indexed as
+    table[name][orientation][column].
+    """
+    table = {}
+    for name, orientations in ORIENTATIONS.items():
+        by_orientation = []
+        for orientation, cells in enumerate(orientations):
+            piece_height = max(cell[0] for cell in cells) + 1
+            piece_width = max(cell[1] for cell in cells) + 1
+            row_masks = [0] * piece_height
+            bottom = [0] * piece_width
+            for row, col in cells:
+                row_masks[row] |= 1 << col
+                bottom[col] = max(bottom[col], row)
+            by_orientation.append(
+                tuple(
+                    Placement(
+                        name=name,
+                        orientation=orientation,
+                        column=column,
+                        width=piece_width,
+                        height=piece_height,
+                        cells=tuple((row, col + column) for row, col in cells),
+                        masks=tuple(mask << column for mask in row_masks),
+                        bottom=tuple(bottom),
+                    )
+                    for column in range(width - piece_width + 1)
+                )
+            )
+        table[name] = tuple(by_orientation)
+    return table
+
+
+TABLE = piece_table()
+
+
+# Ways a PieceSequence can deal pieces
+SEQUENCE_MODES = ("uniform", "bag")
+
+
+class PieceSequence:
+    """
+    The order pieces are dealt in, generated on demand from its own
+    random.Random. Pieces are looked up by index, so boards sharing a sequence
+    each keep their own position in it and never disturb one another, and two
+    sequences with the same seed and mode deal the same pieces.
+
+    mode "uniform" picks every piece independently, "bag" deals shuffled bags
+    of one of each piece. names can give the start of the sequence up front,
+    after which it carries on generating as usual.
+    """
+
+    def __init__(
+        self,
+        seed: int | None = None,
+        mode: str = "uniform",
+        names: Sequence[str] = (),
+        pieces: Mapping[str, Mapping] = PIECES,
+    ):
+        if mode not in SEQUENCE_MODES:
+            raise ValueError(f"Unknown mode {mode}, expected one of {SEQUENCE_MODES}")
+        self.seed = seed
+        self.mode = mode
+        self.pieces = pieces
+        self.rng = random.Random(seed)
+        self.sequence: list[Mapping] = [pieces[name] for name in names]
+
+    def __getstate__(self) -> dict:
+        """
+        The sequence's state for pickling, with pieces by name, as the read
+        only piece definitions cannot be pickled themselves.
+        """
+        state = self.__dict__.copy()
+        state["pieces"] = None if self.pieces is PIECES else self.pieces
+        state["sequence"] = [piece["name"] for piece in self.sequence]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        if self.pieces is None:
+            self.pieces = PIECES
+        self.sequence = [self.pieces[name] for name in self.sequence]
+
+    def __getitem__(self, index: int) -> Mapping:
+        while index >= len(self.sequence):
+            self.extend()
+        return self.sequence[index]
+
+    def extend(self):
+        """
+        Generate the next bag of pieces, or the next piece in uniform mode.
+        """
+        choices = list(self.pieces.values())
+        if self.mode == "bag":
+            self.sequence += self.rng.sample(choices, len(choices))
+        else:
+            self.sequence.append(self.rng.choice(choices))
+
+    def names(self, count: int) -> list[str]:
+        """
+        Names of the first count pieces.
+        """
+        return [self[index]["name"] for index in range(count)]
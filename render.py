@@ -0,0 +1,210 @@
+from functools import cache
+import os
+from typing import Mapping
+
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
+import pygame as pg
+
+# Keyboard controls for human play
+KEYS = {
+    pg.K_RIGHT: "RIGHT",
+    pg.K_d: "RIGHT",
+    pg.K_LEFT: "LEFT",
+    pg.K_a: "LEFT",
+    pg.K_SPACE: "HARDDROP",
+    pg.K_UP: "ROT_CLOCKWISE",
+    pg.K_x: "ROT_CLOCKWISE",
+    pg.K_z: "ROT_ANTICLOCKWISE",
+    pg.K_c: "HOLD",
+}
+
+
+@cache
+def cell_image(colour, size: int) -> pg.Surface:
+    """
+    A filled cell of the given colour and size, drawn once and reused.
+    """
+    image = pg.Surface((size, size), pg.SRCALPHA)
+    pg.draw.rect(image, colour, (0, 0, size, size), border_radius=int(size / 5))
+    pg.draw.rect(
+        image,
+        (0, 0, 0),
+        (0, 0, size, size),
+        width=max(1, int(size / 15)),
+        border_radius=int(size / 5),
+    )
+    return image
+
+
+@cache
+def font(size: int) -> pg.font.Font:
+    return pg.font.SysFont("Arial", size)
+
+
+class BoardSprite(pg.sprite.Sprite):
+    """
+    Sprite drawing a headless board, advancing the game on each update.
+
+    The background and grid are drawn once per square size, and each update
+    only redraws the cells that changed since the last one.
+    """
+
+    def __init__(self, board):
+        super().__init__()
+        self.board = board
+        self.square_size = 0
+        self.rect: pg.rect.Rect = pg.Rect(0, 0, 0, 0)
+        self.background: pg.Surface | None = None
+        # the cell values currently drawn on self.image
+        self.drawn: list[list] = []
+        self.draw_board()
+
+    def update(self, tick=False):
+        self.board.update(tick=tick)
+        self.draw_board()
+
+    def draw_background(self):
+        """
+        Draw the background and grid lines, and start the image from them.
+        """
+        self.background = pg.Surface(
+            (
+                self.square_size * self.board.width,
+                self.square_size * self.board.height,
+            )
+        )
+        # BG colour
+        self.background.fill("lightgray")
+        # Border colour
+        pg.draw.rect(self.background, "black", self.background.get_rect(), 1)
+
+        # Draw grid
+        for col in range(1, self.board.width):
+            pg.draw.line(
+                self.background,
+                "darkgray",
+                (col * self.square_size, 1),
+                (col * self.square_size, self.background.get_height() - 1),
+            )
+        for row in range(1, self.board.height):
+            pg.draw.line(
+                self.background,
+                "darkgray",
+                (1, row * self.square_size),
+                (self.background.get_width() - 1, row * self.square_size),
+            )
+
+        self.image = self.background.copy()
+        self.drawn = [[None] * self.board.width for _ in range(self.board.height)]
+
+    def draw_cell(self, rownum: int, colnum: int, cell):
+        area = pg.Rect(
+            colnum * self.square_size,
+            rownum * self.square_size,
+            self.square_size,
+            self.square_size,
+        )
+        self.image.blit(self.background, area, area)
+        # cells are colours, or True on boards that don't keep colours
+        if cell:
+            colour = "gray" if cell is True else cell
+            self.image.blit(cell_image(colour, self.square_size), area)
+
+    def draw_board(self):
+        win = pg.display.get_surface()
+        if win:
+            square_size = int(win.get_height() / (self.board.height + 1))
+            if square_size * self.board.width + 60 > win.get_width():
+                square_size = int(win.get_width() / (self.board.width + 4))
+            if square_size != self.square_size or self.background is None:
+                self.square_size = square_size
+                self.draw_background()
+
+            # Draw the cells that changed
+            for rownum, row in enumerate(self.board.to_grid()):
+                drawn = self.drawn[rownum]
+                if row == drawn:
+                    continue
+                for colnum, cell in enumerate(row):
+                    if cell != drawn[colnum]:
+                        self.draw_cell(rownum, colnum, cell)
+                        drawn[colnum] = cell
+
+            # DEV (Display current piece real position)
+            # if self.current_piece:
+            #     for coord in self.current_piece:
+            #         pg.draw.rect(
+            #             self.image,
+            #             "purple",
+            #             (
+            #                 int(coord[1] * square_size),
+            #                 int(coord[0] * square_size),
+            #                 int(square_size / 2),
+            #                 int(square_size / 2),
+            #             ),
+            #         )
+
+            self.rect = self.image.get_rect()
+            self.rect.center = win.get_rect().center
+
+
+class PieceDisplay(pg.sprite.Sprite):
+    def __init__(self, sprite: BoardSprite, type: str = "next"):
+        super().__init__()
+        self.sprite = sprite
+        self.board = sprite.board
+        self.type = type
+        # what the current image shows, so it is only redrawn on a change
+        self.drawn: tuple | None = None
+        self.update()
+
+    def update(self, tick=False):
+        win = pg.display.get_surface()
+        square_size = int(self.sprite.square_size * 2 / 3)
+        piece = self.board.next_piece if self.type == "next" else self.board.saved_piece
+        drawn = (piece and piece["name"], win.get_height(), square_size)
+        if drawn != self.drawn:
+            self.drawn = drawn
+            self.draw_piece(win, piece, square_size)
+
+        self.rect = self.image.get_rect()
+        if self.type == "next":
+            self.rect.topleft = self.sprite.rect.topright
+            self.rect.top += 10
+            self.rect.left += 10
+        else:
+            self.rect.topright = self.sprite.rect.topleft
+            self.rect.top += 60
+            self.rect.right -= 10
+
+    def draw_piece(self, win: pg.Surface, piece: Mapping | None, square_size: int):
+        self.image = pg.Surface((win.get_height() * 0.1, win.get_height() * 0.3))
+        self.image.fill("grey")
+        if piece:
+            for rownum, row in enumerate(piece["shape"]):
+                for colnum, cell in enumerate(row):
+                    if cell:
+                        self.image.blit(
+                            cell_image(piece["colour"], square_size),
+                            (colnum * square_size, rownum * square_size),
+                        )
+
+
+class ScoreDisplay(pg.sprite.Sprite):
+    def __init__(self, sprite: BoardSprite):
+        super().__init__()
+        self.sprite = sprite
+        self.board = sprite.board
+        self.drawn: tuple | None = None
+        self.update()
+
+    def update(self, tick=False):
+        win = pg.display.get_surface()
+        size = int(win.get_height() * 0.025)
+        if (self.board.score, size) != self.drawn:
+            self.drawn = (self.board.score, size)
+            self.image = font(size).render(f"{self.board.score}", True, (0, 0, 0))
+        self.rect = self.image.get_rect()
+        self.rect.topright = self.sprite.rect.topleft
+        self.rect.top += 10
+        self.rect.right -= 10
@@ -0,0 +1,194 @@
+"""
+Compact binary game logs and a headless replayer.
+
+A log starts with a header giving the board size and the piece sequence's
+mode and seed, followed by an append-only stream of records:
+
+    1 byte   0b1000_0ppp                      piece p dealt by the sequence
+    5 bytes  0b00pp_pooh, column, row, delta  piece p locked in orientation o
+    1 byte   0b1001_0000                      the game was lost
+
+where h is set when HOLD was used for the piece, row is the top of the
+piece's bounding box and delta (2 bytes) is the score the placement gained,
+including its drop points and line clears. The game over record covers games
+lost by a HOLD rather than a placement. Every piece dealt is logged, so a
+game replays exactly whatever its sequence was, and placements are logged
+where they locked, so moves slid under overhangs replay too.
+
+Replaying places each logged piece with the engine's place(), so long games
+rebuild at full engine speed without pygame or keypresses.
+"""
+
+import struct
+from typing import BinaryIO, Iterator
+
+from bitboard import BitBoard
+from pieces import PIECE_IDS, PIECE_NAMES, PIECES, SEQUENCE_MODES, PieceSequence
+
+MAGIC = b"TRPL"
+VERSION = 1
+# magic, version, width, height, mode, whether there is a seed, seed
+HEADER = struct.Struct("<4sBBBBBQ")
+PLACEMENT = struct.Struct("<BBBH")
+DEAL = 0x80
+GAME_OVER = 0x90
+
+
+class Recorder:
+    """
+    Streams a board's placements to a log as they happen. The board calls
+    lock() and spawn() while a recorder is attached, and copies of the board
+    are never recorded.
+    """
+
+    def __init__(self, board, path: str):
+        seed = board.sequence.seed
+        if seed is not None and (type(seed) is not int or not 0 <= seed < 1 << 64):
+            raise ValueError(
+                f"Only seeds from 0 to 2**64 - 1 can be logged, not {seed!r}"
+            )
+        # packed before the file is created, so a bad header leaves no log
+        header = HEADER.pack(
+            MAGIC,
+            VERSION,
+            board.width,
+            board.height,
+            SEQUENCE_MODES.index(board.sequence.mode),
+            seed is not None,
+            seed or 0,
+        )
+        self.board = board
+        self.file: BinaryIO = open(path, "wb")
+        self.file.write(header)
+        self.dealt = 0
+        # the last locked piece, written once its score is known
+        self.pending: tuple[int, int, int] | None = None
+        self.score = board.score
+        board.recorder = self
+        self.deal()
+
+    def deal(self):
+        """
+        Log the pieces the sequence will deal up to three ahead of the board,
+        enough for the replayer to make the next placement.
+        """
+        sequence = self.board.sequence
+        while self.dealt < self.board.drawn + 3:
+            self.file.write(bytes([DEAL | PIECE_IDS[sequence[self.dealt]["name"]]]))
+            self.dealt += 1
+
+    def lock(self, piece: str, orientation: int, column: int, row: int, hold: bool):
+        flags = (PIECE_IDS[piece] << 3) | (orientation << 1) | hold
+        self.pending = (flags, column, row)
+
+    def spawn(self, score: int):
+        """
+        Called as the board spawns a piece, once the score of the last
+        placement's line clears has been added.
+        """
+        if self.pending:
+            flags, column, row = self.pending
+            self.file.write(PLACEMENT.pack(flags, column, row, score - self.score))
+            self.pending = None
+        self.score = score
+        self.deal()
+        # keep the log on disk up to the last placement if the game crashes
+        self.file.flush()
+
+    def close(self):
+        if self.pending:
+            self.spawn(self.board.score)
+        if self.board.defeated:
+            self.file.write(bytes([GAME_OVER]))
+        self.board.recorder = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_log(path: str) -> tuple[dict, Iterator[tuple]]:
+    """
+    The header of a log as a dict, and an iterator over its records:
+    ("deal", piece), ("place", piece, orientation, column, row, hold, delta)
+    and ("game_over",).
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, version, width, height, mode, has_seed, seed = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} replay log")
+    header = {
+        "width": width,
+        "height": height,
+        "mode": SEQUENCE_MODES[mode],
+        "seed": seed if has_seed else None,
+    }
+
+    def records():
+        offset = HEADER.size
+        while offset < len(data):
+            flags = data[offset]
+            if flags == GAME_OVER:
+                yield ("game_over",)
+                offset += 1
+            elif flags & DEAL:
+                yield ("deal", PIECE_NAMES[flags & 0x7])
+                offset += 1
+            else:
+                flags, column, row, delta = PLACEMENT.unpack_from(data, offset)
+                piece = PIECE_NAMES[flags >> 3]
+                yield (
+                    "place",
+                    piece,
+                    (flags >> 1) & 0x3,
+                    column,
+                    row,
+                    flags & 1,
+                    delta,
+                )
+                offset += PLACEMENT.size
+
+    return header, records()
+
+
+def states(path: str, engine=BitBoard) -> Iterator:
+    """
+    Replay a log, yielding the board after every placement, and once more
+    if the log ends with a game over. The same board is yielded each time,
+    so copy it to keep an intermediate state.
+    """
+    header, records = read_log(path)
+    sequence = PieceSequence(mode=header["mode"])
+    board = None
+    for record in records:
+        if record[0] == "deal":
+            sequence.sequence.append(PIECES[record[1]])
+            continue
+        if board is None:
+            board = engine(header["width"], header["height"], sequence=sequence)
+        if record[0] == "game_over":
+            board.defeated = True
+            yield board
+            continue
+        _, piece, orientation, column, row, hold, delta = record
+        if hold:
+            board.input("HOLD", update=False)
+        score = board.score
+        board.place(piece, orientation, column, row=row)
+        board.score = score + delta
+        yield board
+
+
+def replay(path: str, pieces: int | None = None, engine=BitBoard):
+    """
+    The board after the first pieces placements of a log, or the whole game.
+    """
+    board = None
+    for placed, board in enumerate(states(path, engine), 1):
+        if placed == pieces:
+            break
+    return board
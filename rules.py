@@ -0,0 +1,34 @@
+"""
+Scoring rules shared by the board engines.
+"""
+
+from typing import NamedTuple
+
+SCORING = {0: 0, 1: 100, 2: 300, 3: 500, 4: 800}
+PERFECT_CLEAR_SCORING = {0: 0, 1: 800, 2: 1200, 3: 1800, 4: 2000}
+
+
+class PlaceEvent(NamedTuple):
+    """
+    Outcome of locking a piece with place().
+    """
+
+    lines_cleared: int
+    score_delta: int
+    perfect_clear: bool
+
+
+def line_clear_score(
+    cleared_lines: int, difficult_combo: int, perfect_clear: bool
+) -> int:
+    """
+    Points for clearing lines, given the tetris combo after this clear.
+    """
+    if not cleared_lines:
+        return 0
+    if perfect_clear:
+        # back to back tetris perfect clear
+        if difficult_combo >= 2:
+            return 3200
+        return PERFECT_CLEAR_SCORING[cleared_lines]
+    return int(SCORING[cleared_lines] * (1.5 if difficult_combo >= 2 else 1))
@@ -0,0 +1,170 @@
+"""
+Resumable evaluation of (weights, seed) jobs on a process pool.
+
+    python runner.py sweep.jsonl --seeds 1000                  default weights
+    python runner.py sweep.jsonl --seeds 1000 -w weights.json  each of a list
+    python runner.py sweep.jsonl --seeds 1000 --max-pieces 5000
+
+Each job plays one greedy game of the client with its weights on a board
+dealt from its seed. Jobs are handed to the workers one at a time as they
+free up, so a slow game only holds up its own worker, and every result is
+appended to a JSONL file and flushed as soon as it finishes. Running the same
+jobs against the same file again skips the ones already in it, so a crashed
+or interrupted sweep carries on where it stopped.
+"""
+
+import json
+from multiprocessing import Pool
+import os
+import sys
+import time
+from typing import Iterator, Sequence, TextIO
+
+from bitboard import BitBoard
+from client import TetrisClient
+import stats
+
+
+def job_key(weights: Sequence[float] | None, seed: int, max_pieces: int | None):
+    """
+    What identifies a job in the results file. None weights are the client's
+    defaults.
+    """
+    if weights is not None:
+        weights = [float(weight) for weight in weights]
+    return json.dumps([weights, seed, max_pieces])
+
+
+def play(job) -> dict:
+    """
+    Play one job's game. Returns its result as written to the results file.
+    """
+    weights, seed, max_pieces, show_stats = job
+    if show_stats:
+        stats.enable()
+        stats.STATS.reset()
+    start = time.perf_counter()
+    board = BitBoard(seed=seed)
+    client = TetrisClient(board) if weights is None else TetrisClient(board, weights)
+    while not board.defeated and (
+        max_pieces is None or board.total_pieces < max_pieces
+    ):
+        client.move()
+    result = {
+        "key": job_key(weights, seed, max_pieces),
+        "weights": None if weights is None else [float(w) for w in weights],
+        "seed": seed,
+        "max_pieces": max_pieces,
+        "score": board.score,
+        "pieces": board.total_pieces,
+        "seconds": time.perf_counter() - start,
+    }
+    if show_stats:
+        result["stats"] = stats.STATS.as_dict()
+        stats.disable()
+    return result
+
+
+def finished(path: str) -> set[str]:
+    """
+    Keys of the jobs already in a results file. A line cut short by a crash
+    is ignored, so its job runs again.
+    """
+    keys = set()
+    if not os.path.exists(path):
+        return keys
+    with open(path) as file:
+        for line in file:
+            try:
+                keys.add(json.loads(line)["key"])
+            except (ValueError, KeyError):
+                continue
+    return keys
+
+
+def open_results(path: str) -> TextIO:
+    """
+    Open a results file for appending, starting a fresh line if the last one
+    was cut short.
+    """
+    file = open(path, "a+")
+    if file.tell():
+        file.seek(file.tell() - 1)
+        if file.read(1) != "\n":
+            file.write("\n")
+    return file
+
+
+def run(
+    jobs: Sequence[tuple[Sequence[float] | None, int]],
+    path: str | None = None,
+    processes: int | None = None,
+    max_pieces: int | None = None,
+    show_stats: bool = False,
+    progress: TextIO | None = sys.stderr,
+) -> Iterator[dict]:
+    """
+    Play every (weights, seed) job not already in the results file at path,
+    yielding each result as it finishes and writing it to the file. Live
+    throughput goes to progress, if given.
+    """
+    done = finished(path) if path else set()
+    pending = [
+        (weights, seed, max_pieces, show_stats)
+        for weights, seed in jobs
+        if job_key(weights, seed, max_pieces) not in done
+    ]
+    if progress and len(pending) < len(jobs):
+        print(f"Skipping {len(jobs) - len(pending)} finished jobs", file=progress)
+    if not pending:
+        return
+
+    file = open_results(path) if path else None
+    games = pieces = 0
+    start = time.perf_counter()
+    try:
+        with Pool(processes) as pool:
+            for result in pool.imap_unordered(play, pending):
+                if file:
+                    file.write(json.dumps(result) + "\n")
+                    file.flush()
+                games += 1
+                pieces += result["pieces"]
+                if progress:
+                    elapsed = time.perf_counter() - start
+                    print(
+                        f"\r{games}/{len(pending)} games"
+                        f"  {games / elapsed:.2f} games/s"
+                        f"  {pieces / elapsed:.0f} pieces/s",
+                        end="\n" if games == len(pending) else "",
+                        file=progress,
+                        flush=True,
+                    )
+                yield result
+    finally:
+        if file:
+            file.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("results", help="JSONL file the results are appended to")
+    parser.add_argument("--seeds", type=int, default=16, help="seeds 0 to N - 1")
+    parser.add_argument("-w", "--weights", help="JSON file of a list of weights")
+    parser.add_argument("-p", "--processes", type=int, help="worker processes")
+    parser.add_argument("--max-pieces", type=int, help="stop each game after this")
+    args = parser.parse_args()
+
+    population = [None]
+    if args.weights:
+        with open(args.weights) as file:
+            population = json.load(file)
+    for _ in run(
+        [(weights, seed) for weights in population for seed in range(args.seeds)],
+        path=args.results,
+        processes=args.processes,
+        max_pieces=args.max_pieces,
+    ):
+        pass
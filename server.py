@@ -0,0 +1,282 @@
+"""
+A local game server hosting many headless games in one long-running process,
+and a client library for it.
+
+    python server.py                      serve on 127.0.0.1:5577
+    python server.py --port 6000          ... on another port
+    python server.py --unix tetris.sock    serve on a Unix socket instead
+
+Bots connect with GameClient rather than building their own boards:
+
+    with GameClient() as server:
+        game = server.new(seed=1)["game"]
+        state = server.input(game, ["LEFT", "HARDDROP"])["state"]
+
+Requests and replies are single lines of JSON. A request is one command or a
+list of them, which are run in order and answered with one line holding the
+list of replies, so a bot can step many games with one round trip:
+
+    {"cmd": "new", "seed": 1, "mode": "bag", "engine": "bitboard"}
+    {"cmd": "state", "game": 1}
+    {"cmd": "input", "game": 1, "keys": ["LEFT", "HARDDROP"], "tick": false}
+    {"cmd": "place", "game": 1, "piece": "T", "orientation": 0, "column": 3}
+    {"cmd": "close", "game": 1}
+
+Each reply is a dict, or {"error": message} if its command failed. The
+server only ever listens on localhost.
+"""
+
+import asyncio
+import json
+import socket
+from typing import Sequence
+
+from bitboard import BitBoard
+from board import Board
+from pieces import PIECES
+
+ENGINES = {"board": Board, "bitboard": BitBoard}
+# Board sizes a game can be made with: room for every piece in every
+# orientation, and no more columns than batch.POPCOUNT's 16 bits count
+MIN_SIZE = max(
+    max(len(piece["shape"]), len(piece["shape"][0])) for piece in PIECES.values()
+)
+MAX_WIDTH = 16
+MAX_HEIGHT = 32
+HOST = "127.0.0.1"
+PORT = 5577
+
+
+def board_state(board) -> dict:
+    """
+    Everything a bot needs to choose a move, in plain JSON types. Rows are the
+    locked blocks as bitmasks, bit c being column c, and position is the
+    active piece's (orientation, column, row) as used by place().
+    """
+    return {
+        "width": board.width,
+        "height": board.height,
+        "rows": list(board.row_masks()),
+        "piece": board.current_piece["name"],
+        "position": board.position(),
+        "next": board.next_piece["name"],
+        "saved": board.saved_piece["name"] if board.saved_piece else None,
+        "hold_used": board.hold_used,
+        "score": board.score,
+        "total_pieces": board.total_pieces,
+        "defeated": board.defeated,
+    }
+
+
+class GameServer:
+    """
+    The games being played, by id, and the commands that act on them.
+    """
+
+    def __init__(self):
+        self.games: dict[int, object] = {}
+        self.next_id = 1
+
+    def game(self, command: dict):
+        try:
+            return self.games[command["game"]]
+        except KeyError:
+            raise ValueError(f"No game {command.get('game')}")
+
+    def new(self, command: dict) -> dict:
+        engine = command.get("engine", "bitboard")
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine}, expected one of {ENGINES}")
+        width = command.get("width", 10)
+        height = command.get("height", 20)
+        for name, size, largest in (
+            ("width", width, MAX_WIDTH),
+            ("height", height, MAX_HEIGHT),
+        ):
+            if type(size) is not int or not MIN_SIZE <= size <= largest:
+                raise ValueError(
+                    f"{name} must be an integer from {MIN_SIZE} to {largest}, got {size!r}"
+                )
+        board = ENGINES[engine](
+            width=width,
+            height=height,
+            seed=command.get("seed"),
+            mode=command.get("mode", "uniform"),
+        )
+        game = self.next_id
+        self.next_id += 1
+        self.games[game] = board
+        return {"game": game, "state": board_state(board)}
+
+    def state(self, command: dict) -> dict:
+        return {"state": board_state(self.game(command))}
+
+    def input(self, command: dict) -> dict:
+        board = self.game(command)
+        successes = board.input(list(command["keys"]), update=False)
+        board.update(tick=command.get("tick", False))
+        return {"successes": successes, "state": board_state(board)}
+
+    def place(self, command: dict) -> dict:
+        board = self.game(command)
+        event = board.place(
+            command["piece"],
+            command["orientation"],
+            command["column"],
+            row=command.get("row"),
+        )
+        return {"event": event._asdict(), "state": board_state(board)}
+
+    def close(self, command: dict) -> dict:
+        self.game(command)
+        del self.games[command["game"]]
+        return {}
+
+    def handle(self, command: dict) -> dict:
+        """
+        Run one command, turning any failure into an error reply so one bad
+        command never takes down the other games.
+        """
+        name = command.get("cmd") if isinstance(command, dict) else None
+        if name not in ("new", "state", "input", "place", "close"):
+            return {"error": f"Unknown command {name}"}
+        try:
+            return getattr(self, name)(command)
+        except Exception as error:
+            return {"error": f"{type(error).__name__}: {error}"}
+
+    def reply(self, line: bytes) -> bytes:
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            reply = {"error": f"Invalid JSON: {error}"}
+        else:
+            if isinstance(request, list):
+                reply = [self.handle(command) for command in request]
+            else:
+                reply = self.handle(request)
+        return json.dumps(reply, separators=(",", ":")).encode() + b"\n"
+
+    async def serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while line := await reader.readline():
+                writer.write(self.reply(line))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, port: int = PORT, path: str | None = None):
+        if path:
+            server = await asyncio.start_unix_server(self.serve_client, path)
+        else:
+            server = await asyncio.start_server(self.serve_client, HOST, port)
+        async with server:
+            await server.serve_forever()
+
+
+class ServerError(Exception):
+    """
+    A command sent to the game server failed.
+    """
+
+
+class GameClient:
+    """
+    A blocking connection to a game server. Every command waits for its
+    reply; batch() sends many in one request.
+    """
+
+    def __init__(self, port: int = PORT, path: str | None = None):
+        if path:
+            self.socket = socket.socket(socket.AF_UNIX)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((HOST, port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.socket.makefile("rwb")
+
+    def request(self, request: dict | list[dict]):
+        self.file.write(json.dumps(request, separators=(",", ":")).encode() + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("The game server closed the connection")
+        return json.loads(line)
+
+    def batch(self, commands: Sequence[dict]) -> list[dict]:
+        """
+        Run commands in order with one round trip. Failed commands give
+        error replies rather than raising, so the rest still run.
+        """
+        return self.request(list(commands))
+
+    def command(self, cmd: str, **arguments) -> dict:
+        reply = self.request({"cmd": cmd, **arguments})
+        if "error" in reply:
+            raise ServerError(reply["error"])
+        return reply
+
+    def new(
+        self,
+        seed: int | None = None,
+        mode: str = "uniform",
+        engine: str = "bitboard",
+        width: int = 10,
+        height: int = 20,
+    ) -> dict:
+        return self.command(
+            "new", seed=seed, mode=mode, engine=engine, width=width, height=height
+        )
+
+    def state(self, game: int) -> dict:
+        return self.command("state", game=game)["state"]
+
+    def input(self, game: int, keys: Sequence[str], tick: bool = False) -> dict:
+        return self.command("input", game=game, keys=list(keys), tick=tick)
+
+    def place(
+        self,
+        game: int,
+        piece: str,
+        orientation: int,
+        column: int,
+        row: int | None = None,
+    ) -> dict:
+        return self.command(
+            "place",
+            game=game,
+            piece=piece,
+            orientation=orientation,
+            column=column,
+            row=row,
+        )
+
+    def close_game(self, game: int):
+        self.command("close", game=game)
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--port", type=int, default=PORT, help="TCP port on localhost")
+    parser.add_argument("--unix", help="serve on this Unix socket path instead")
+    args = parser.parse_args()
+    try:
+        asyncio.run(GameServer().serve(port=args.port, path=args.unix))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,481 @@
+"""
+Lockstep simulator playing many independent games at once with NumPy.
+
+Every game is driven by the same greedy policy as TetrisClient with its
+default generator and a depth of 1: each turn the placements of the current
+piece and of the piece HOLD would bring in that its moves can reach, turning
+where the piece spawns and sliding along the top rows, are scored with the
+weighted holes/height/wells formula, or with a set of features.py features,
+and the best one is placed, following the rules of Board.place. Ties go to
+the placement TetrisClient tries first, so both play the same games from the
+same pieces. Boards are kept as row bitmasks like BitBoard.rows, and each
+turn is a handful of array operations over every game and candidate
+together. Finished games are masked out rather than stopping the batch.
+"""
+
+from functools import cache
+from typing import Sequence
+
+import numpy as np
+
+import batch
+import features as features_module
+from pieces import PIECE_NAMES, SEQUENCE_MODES, SPAWN_OFFSETS, piece_table
+from rules import PERFECT_CLEAR_SCORING, SCORING
+
+# Bumped whenever a change alters the games played, so saved fitnesses from
+# older simulators are not reused
+ENGINE_VERSION = 2
+
+
+@cache
+def simulator_tables(width: int = 10) -> dict[str, np.ndarray]:
+    """
+    Every piece's placements from the piece table, padded into arrays indexed
+    by [piece id, placement], along with the spawn masks and scoring tables.
+    """
+    table = piece_table(width)
+    placements = [
+        [placement for columns in table[name] for placement in columns]
+        for name in PIECE_NAMES
+    ]
+    count = max(len(piece_placements) for piece_placements in placements)
+    shape = (len(PIECE_NAMES), count)
+    placement_valid = np.zeros(shape, dtype=bool)
+    # row bitmasks of the placement's bounding box, padded to four rows
+    placement_masks = np.zeros(shape + (4,), dtype=np.int64)
+    # lowest row offset of the placement in each board column it covers
+    placement_bottom = np.zeros(shape + (width,), dtype=np.int64)
+    placement_covers = np.zeros(shape + (width,), dtype=bool)
+    placement_orientation = np.zeros(shape, dtype=np.int64)
+    for piece, piece_placements in enumerate(placements):
+        for index, placement in enumerate(piece_placements):
+            placement_valid[piece, index] = True
+            placement_orientation[piece, index] = placement.orientation
+            placement_masks[piece, index, : placement.height] = placement.masks
+            for col, bottom in enumerate(placement.bottom):
+                placement_bottom[piece, index, placement.column + col] = bottom
+                placement_covers[piece, index, placement.column + col] = True
+
+    # row bitmasks of the top of the board each piece spawns into
+    spawn_height = max(
+        SPAWN_OFFSETS[name][0] + table[name][0][0].height for name in PIECE_NAMES
+    )
+    spawn_masks = np.zeros((len(PIECE_NAMES), spawn_height), dtype=np.int64)
+    # the column each piece spawns at, the number of its orientations and the
+    # placement of each orientation at that column, -1 if it is too wide
+    spawn_columns = np.zeros(len(PIECE_NAMES), dtype=np.int64)
+    orientation_counts = np.zeros(len(PIECE_NAMES), dtype=np.int64)
+    spawn_placements = np.full((len(PIECE_NAMES), 4), -1, dtype=np.int64)
+    for piece, name in enumerate(PIECE_NAMES):
+        rowoffset, coloffset = SPAWN_OFFSETS[name]
+        column = coloffset + int(width / 2) - 1
+        spawn = table[name][0][column]
+        spawn_masks[piece, rowoffset : rowoffset + spawn.height] = spawn.masks
+        spawn_columns[piece] = column
+        orientation_counts[piece] = len(table[name])
+        first = 0
+        for orientation, columns in enumerate(table[name]):
+            if column < len(columns):
+                spawn_placements[piece, orientation] = first + column
+            first += len(columns)
+
+    scoring = np.array([SCORING[lines] for lines in range(5)])
+    perfect_clear_scoring = np.array(
+        [PERFECT_CLEAR_SCORING[lines] for lines in range(5)]
+    )
+    return {
+        "placement_valid": placement_valid,
+        "placement_masks": placement_masks,
+        "placement_bottom": placement_bottom,
+        "placement_covers": placement_covers,
+        "placement_orientation": placement_orientation,
+        "spawn_masks": spawn_masks,
+        "spawn_columns": spawn_columns,
+        "orientation_counts": orientation_counts,
+        "spawn_placements": spawn_placements,
+        "scoring": scoring,
+        "perfect_clear_scoring": perfect_clear_scoring,
+    }
+
+
+class BatchSimulator:
+    """
+    State of a batch of games advanced together by step().
+    """
+
+    def __init__(
+        self,
+        weights: Sequence[float],
+        games: int = 15,
+        seed: int | Sequence[int] | None = None,
+        width: int = 10,
+        height: int = 20,
+        mode: str = "uniform",
+        features: Sequence[str] | None = None,
+    ):
+        if mode not in SEQUENCE_MODES:
+            raise ValueError(f"Unknown mode {mode}, expected one of {SEQUENCE_MODES}")
+        if features is not None:
+            features_module.check(features, weights)
+        self.weights = weights
+        # Evaluate with these features.py features instead of the default ones
+        self.features = features
+        self.games = games
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.rng = np.random.default_rng(seed)
+        self.build_tables()
+
+        self.full_mask = (1 << width) - 1
+        self.rows = np.zeros((games, height), dtype=np.int64)
+        self.score = np.zeros(games, dtype=np.int64)
+        self.difficult_combo = np.zeros(games, dtype=np.int64)
+        self.total_pieces = np.zeros(games, dtype=np.int64)
+        self.alive = np.ones(games, dtype=bool)
+
+        # Each game draws from its own piece sequence, extended as needed
+        self.sequence = np.empty((games, 0), dtype=np.int64)
+        self.drawn = np.zeros(games, dtype=np.int64)
+        self.current_piece = self.draw(np.arange(games))
+        self.next_piece = self.draw(np.arange(games))
+        self.saved_piece = np.full(games, -1, dtype=np.int64)
+
+    def build_tables(self):
+        """
+        Take the placement, spawn and scoring arrays for the board width from
+        simulator_tables(), built once per process and shared by every
+        simulator. They are only ever read.
+        """
+        for name, array in simulator_tables(self.width).items():
+            setattr(self, name, array)
+
+    def peek(self, games: np.ndarray) -> np.ndarray:
+        """
+        The piece each of the given games will draw next.
+        """
+        needed = int(self.drawn[games].max(initial=0)) + 1
+        if needed > self.sequence.shape[1]:
+            self.extend()
+        return self.sequence[games, self.drawn[games]]
+
+    def extend(self):
+        """
+        Generate more of every game's piece sequence, as independent picks or
+        as shuffled bags of one of each piece depending on the mode.
+        """
+        count = len(PIECE_NAMES)
+        if self.mode == "bag":
+            bags = np.tile(np.arange(count), (self.games, 256 // count + 1, 1))
+            extra = self.rng.permuted(bags, axis=2).reshape(self.games, -1)
+        else:
+            extra = self.rng.integers(0, count, size=(self.games, 256))
+        self.sequence = np.concatenate([self.sequence, extra], axis=1)
+
+    def draw(self, games: np.ndarray) -> np.ndarray:
+        """
+        Draw the next piece for each of the given games.
+        """
+        pieces = self.peek(games)
+        self.drawn[games] += 1
+        return pieces
+
+    def candidates(self, games: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Every placement of the current piece and of the piece HOLD would bring
+        in, for each of the given games. Returns arrays of shape (games,
+        candidates): the rows after the placement, the score, tetris combo
+        and features the evaluation uses, whether it is valid, the order
+        TetrisClient tries it in, whether it was a HOLD, the piece spawned
+        after it and whether that piece tops out. Valid placements are the
+        ones TetrisClient's moves reach.
+        With a set of features, "features" stacks them on a last axis, and
+        the landing height and eroded cells they need are included as well.
+        """
+        count = len(games)
+        height, width = self.height, self.width
+        rows = self.rows[games]
+        current = self.current_piece[games]
+        saved = self.saved_piece[games]
+        has_saved = saved >= 0
+        held = np.where(has_saved, saved, self.next_piece[games])
+
+        # Candidates are every placement of the current piece, then every
+        # placement of the piece HOLD would bring in
+        placements = self.placement_valid.shape[1]
+        pieces = np.repeat(np.stack([current, held], axis=1), placements, axis=1)
+        hold = np.zeros(2 * placements, dtype=bool)
+        hold[placements:] = True
+        index = np.tile(np.arange(placements), 2)
+        valid = self.placement_valid[pieces, index]
+
+        # Drop each candidate from the top rows, where it spawns, onto the
+        # first block under its lowest cell in each column it covers
+        cells = (rows[:, :, None] >> np.arange(width)) & 1 == 1
+        # the first row holding a block at or under each of rows 1 to 4
+        below = np.stack(
+            [
+                np.where(
+                    cells[:, row:].any(axis=1),
+                    row + cells[:, row:].argmax(axis=1),
+                    height,
+                )
+                for row in range(1, 5)
+            ],
+            axis=1,
+        )
+        bottom = self.placement_bottom[pieces, index]
+        clearance = np.where(
+            self.placement_covers[pieces, index],
+            below[np.arange(count)[:, None, None], bottom, np.arange(width)] - bottom,
+            height,
+        )
+        landing = clearance.min(axis=2) - 1
+        valid &= landing >= 0
+        landing = np.maximum(landing, 0)
+
+        masks = self.placement_masks[pieces, index]
+        valid, tried = self.reachable(rows, current, held, masks, valid)
+
+        candidates = np.repeat(rows[:, None], 2 * placements, axis=1)
+        game_index = np.arange(count)[:, None]
+        candidate_index = np.arange(2 * placements)[None, :]
+        for offset in range(masks.shape[2]):
+            # rows past the bottom only ever get an empty mask
+            target = np.minimum(landing + offset, height - 1)
+            candidates[game_index, candidate_index, target] |= masks[:, :, offset]
+
+        # Clear full rows by moving them to the top and emptying them
+        full = candidates == self.full_mask
+        cleared_lines = full.sum(axis=2)
+        clearing = np.nonzero(cleared_lines)
+        if len(clearing[0]):
+            order = np.argsort(~full[clearing], axis=1, kind="stable")
+            compacted = np.take_along_axis(candidates[clearing], order, axis=1)
+            compacted[np.arange(height) < cleared_lines[clearing][:, None]] = 0
+            candidates[clearing] = compacted
+
+        extra = {}
+        if self.features is not None:
+            # the candidate's cells in the rows it completes, before they clear
+            piece_cells = np.zeros(landing.shape, dtype=np.int64)
+            for offset in range(masks.shape[2]):
+                target = np.minimum(landing + offset, height - 1)
+                piece_cells += np.where(
+                    full[game_index, candidate_index, target],
+                    batch.POPCOUNT[masks[:, :, offset]],
+                    0,
+                )
+            extra = {
+                "landing_height": height - landing - (masks != 0).sum(axis=2),
+                "eroded_cells": cleared_lines * piece_cells,
+            }
+
+        combo = self.difficult_combo[games][:, None]
+        combo = np.where(cleared_lines == 4, combo + 1, combo)
+        combo = np.where((cleared_lines > 0) & (cleared_lines < 4), 0, combo)
+        perfect_clear = (cleared_lines > 0) & (candidates[:, :, -1] == 0)
+        clear_score = np.where(
+            perfect_clear,
+            np.where(combo >= 2, 3200, self.perfect_clear_scoring[cleared_lines]),
+            (self.scoring[cleared_lines] * np.where(combo >= 2, 1.5, 1)).astype(
+                np.int64
+            ),
+        )
+        scores = self.score[games][:, None] + 2 * (landing + 1) + clear_score
+
+        # The piece spawned after each candidate, and whether it fits
+        after_next = self.peek(games)
+        spawned = np.where(
+            hold & ~has_saved[:, None],
+            after_next[:, None],
+            self.next_piece[games][:, None],
+        )
+        spawn_masks = self.spawn_masks[spawned]
+        defeated = (candidates[:, :, : spawn_masks.shape[2]] & spawn_masks).any(axis=2)
+        if self.features is not None:
+            extra["features"] = features_module.from_rows(
+                candidates, width, self.features, **extra
+            )
+
+        return {
+            "rows": candidates,
+            "scores": scores,
+            "combo": combo,
+            "holes": batch.holes_from_rows(candidates, width),
+            "height": batch.height_from_rows(candidates),
+            "wells": batch.wells_from_rows(candidates, width),
+            "defeated": defeated,
+            "valid": valid,
+            "order": tried,
+            "hold": np.broadcast_to(hold, valid.shape),
+            "spawned": spawned,
+            **extra,
+        }
+
+    def reachable(
+        self,
+        rows: np.ndarray,
+        current: np.ndarray,
+        held: np.ndarray,
+        masks: np.ndarray,
+        valid: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Which of the candidates candidates() lays out TetrisClient's
+        permutations can reach, and the order it tries them in, for ties to
+        go the same way. Its moves are an optional HOLD, up to six turns
+        where the piece spawns, each skipped if the turned piece does not
+        fit, then sliding along the top rows as far left as the piece goes
+        and some way right from there before the hard drop.
+        """
+        count = len(rows)
+        placements = self.placement_valid.shape[1]
+        games = np.arange(count)[:, None]
+        position = np.arange(2 * placements)
+        slot = position // placements
+        slots = np.stack([current, held], axis=1)
+        pieces = slots[:, slot]
+
+        # every candidate that fits in the top rows, where pieces spawn, and
+        # the candidate each orientation spawns as, -1 if it is too wide
+        fits = valid & ((rows[:, None, : masks.shape[2]] & masks) == 0).all(axis=2)
+        spawned = self.spawn_placements[slots]
+        spawned = np.where(spawned >= 0, spawned + [[0], [placements]], -1)
+        spawn_fits = (spawned >= 0) & fits[games[:, :, None], np.maximum(spawned, 0)]
+
+        # the first move set reaching each orientation of the current and the
+        # held piece, numbered in TetrisClient's order: none, HOLD, then one,
+        # three and six turns of the current piece and then of the held one
+        unreached = 8
+        first = np.full((count, 2, 4), unreached)
+        first[:, :, 0] = [0, 1]
+        orientation = np.zeros((count, 2), dtype=np.int64)
+        orientations = self.orientation_counts[slots]
+        movesets = {1: [[2], [5]], 3: [[3], [6]], 6: [[4], [7]]}
+        for turn in range(1, 7):
+            turned = (orientation + 1) % orientations
+            turns = np.take_along_axis(spawn_fits, turned[..., None], axis=2)
+            orientation = np.where(turns[..., 0], turned, orientation)
+            if turn in movesets:
+                reached = np.take_along_axis(first, orientation[..., None], axis=2)
+                reached = np.minimum(reached, movesets[turn])
+                np.put_along_axis(first, orientation[..., None], reached, axis=2)
+        # a piece that does not spawn makes no moves at all
+        first = np.where(spawn_fits[:, :, :1], first, unreached)
+
+        # the candidates reached sliding from where each orientation spawns,
+        # up to the nearest ones either side that do not fit
+        candidate_orientation = self.placement_orientation[
+            pieces, position % placements
+        ]
+        moveset = first[games, slot, candidate_orientation]
+        start = spawned[games, slot, candidate_orientation]
+        blocked = np.where(fits, -1, position)
+        before = np.maximum.accumulate(blocked, axis=1)
+        blocked = np.where(fits, 2 * placements, position)
+        after = np.minimum.accumulate(blocked[:, ::-1], axis=1)[:, ::-1]
+        begin = np.take_along_axis(before, np.maximum(start, 0), axis=1)
+        end = np.take_along_axis(after, np.maximum(start, 0), axis=1)
+        valid = valid & (moveset < unreached) & (start >= 0)
+        valid &= (begin < position) & (position < end)
+
+        # TetrisClient tries every move set at each number of slides right
+        # from the leftmost column before moving on to the next
+        leftmost = np.maximum(begin + 1, start - self.spawn_columns[pieces])
+        order = (position - leftmost) * unreached + moveset
+        return valid, order
+
+    def step(self) -> np.ndarray:
+        """
+        Place one piece in every game still running.
+        Returns the indices of the games that were advanced.
+        """
+        games = np.flatnonzero(self.alive)
+        if not len(games):
+            return games
+        count = len(games)
+        current = self.current_piece[games]
+        saved = self.saved_piece[games]
+        has_saved = saved >= 0
+        after_next = self.peek(games)
+        found = self.candidates(games)
+        candidates = found["rows"]
+        scores = found["scores"]
+        combo = found["combo"]
+        defeated = found["defeated"]
+        valid = found["valid"]
+        hold = found["hold"][0]
+        if self.features is not None:
+            evaluation = features_module.evaluate_many(
+                self.weights, self.features, scores, found["features"], defeated
+            )
+        else:
+            evaluation = batch.evaluate(
+                self.weights,
+                scores,
+                found["holes"],
+                found["height"],
+                found["wells"],
+                defeated,
+            )
+        evaluation = np.where(valid, evaluation, -np.inf)
+        # ties go to the candidate TetrisClient would have tried first
+        tied = evaluation == evaluation.max(axis=1, keepdims=True)
+        best = np.where(tied, found["order"], np.iinfo(np.int64).max).argmin(axis=1)
+        chosen = np.arange(count), best
+
+        # Games with nowhere to put the piece are lost as they stand
+        stuck = ~valid.any(axis=1)
+        moved = games[~stuck]
+        self.alive[games[stuck]] = False
+        keep = ~stuck
+        chosen = chosen[0][keep], chosen[1][keep]
+        took_hold = hold[best[keep]]
+
+        self.rows[moved] = candidates[chosen]
+        self.score[moved] = scores[chosen]
+        self.difficult_combo[moved] = combo[chosen]
+        self.total_pieces[moved] += 1
+        self.alive[moved] = ~defeated[chosen]
+
+        # Move the piece queue along, drawing one or two new pieces
+        first_hold = took_hold & ~has_saved[keep]
+        self.saved_piece[moved] = np.where(took_hold, current[keep], saved[keep])
+        new_current = np.where(first_hold, after_next[keep], self.next_piece[moved])
+        self.drawn[moved[first_hold]] += 1
+        self.current_piece[moved] = new_current
+        self.next_piece[moved] = self.draw(moved)
+        return games
+
+    def run(self, max_pieces: int | None = None) -> np.ndarray:
+        """
+        Play every game until it is lost or has placed max_pieces pieces.
+        Returns the final score of each game.
+        """
+        while self.alive.any():
+            if max_pieces is not None:
+                self.alive &= self.total_pieces < max_pieces
+                if not self.alive.any():
+                    break
+            self.step()
+        return self.score.copy()
+
+
+def simulate(
+    weights: Sequence[float],
+    games: int = 15,
+    seed: int | None = None,
+    max_pieces: int | None = None,
+    mode: str = "uniform",
+    features: Sequence[str] | None = None,
+) -> np.ndarray:
+    """
+    Play a batch of games with the given weights in lockstep.
+    Returns the final score of each game.
+    """
+    simulator = BatchSimulator(
+        weights, games=games, seed=seed, mode=mode, features=features
+    )
+    return simulator.run(max_pieces=max_pieces)
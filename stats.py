@@ -0,0 +1,166 @@
+"""
+Optional counters and timers for the hot paths of the engines and client.
+
+Nothing is measured until enable() wraps the instrumented methods, and
+disable() puts the originals back, so runs without instrumentation pay
+nothing for it. Totals gather in STATS:
+
+    stats.enable()
+    ... play ...
+    print(stats.STATS.as_dict())
+    stats.disable()
+
+Any phase can also be run under a profiler by passing a hook, a function
+returning a context manager entered around every call of that phase:
+
+    profiler = cProfile.Profile()
+    stats.enable(hooks={"calculate_move": stats.profiler_hook(profiler)})
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+import time
+from typing import Callable, ContextManager
+
+from bitboard import BitBoard
+from board import Board
+from client import TetrisClient
+
+# Methods timed and counted under each phase name. Times are inclusive, so
+# find_permutations contains the copies and inputs it makes.
+PHASES = {
+    "input": [(Board, "input"), (BitBoard, "input")],
+    "copy": [(Board, "copy"), (BitBoard, "copy")],
+    "clear_lines": [(Board, "clear_lines"), (BitBoard, "clear_lines")],
+    "find_permutations": [(TetrisClient, "find_permutations")],
+    "calculate_move": [(TetrisClient, "calculate_move")],
+    "evaluate": [(TetrisClient, "evaluate")],
+    "batch_scores": [(TetrisClient, "batch_scores")],
+}
+
+
+class Stats:
+    """
+    Call counts and seconds spent per phase, plus the candidates generated,
+    evaluations made and lines cleared.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls: Counter[str] = Counter()
+        self.seconds: Counter[str] = Counter()
+        self.candidates = 0
+        self.evaluations = 0
+        self.lines_cleared = 0
+
+    def as_dict(self) -> dict:
+        moves = self.calls["calculate_move"]
+        return {
+            "calls": dict(self.calls),
+            "seconds": dict(self.seconds),
+            "candidates": self.candidates,
+            "evaluations": self.evaluations,
+            "lines_cleared": self.lines_cleared,
+            "per_move": {
+                "copies": self.calls["copy"] / moves if moves else 0,
+                "candidates": self.candidates / moves if moves else 0,
+                "evaluations": self.evaluations / moves if moves else 0,
+                "seconds": self.seconds["calculate_move"] / moves if moves else 0,
+            },
+        }
+
+
+STATS = Stats()
+
+# The original methods while instrumentation is enabled
+originals: dict[tuple[type, str], Callable] = {}
+# How many calls of each phase are running, so a phase calling itself, as
+# input("HARDDROP") does through input("GRAVITY"), is counted and timed once
+depths: Counter[str] = Counter()
+
+
+def instrument(phase: str, method: Callable, hook: Callable | None) -> Callable:
+    """
+    Wrap a method to count and time its calls under phase. Calls made from
+    within a call of the same phase are left to the outermost one.
+    """
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        if depths[phase]:
+            return method(*args, **kwargs)
+        depths[phase] += 1
+        start = time.perf_counter()
+        try:
+            if hook:
+                with hook():
+                    result = method(*args, **kwargs)
+            else:
+                result = method(*args, **kwargs)
+        finally:
+            depths[phase] -= 1
+        STATS.seconds[phase] += time.perf_counter() - start
+        STATS.calls[phase] += 1
+        if phase == "find_permutations":
+            STATS.candidates += len(result)
+        elif phase == "evaluate":
+            STATS.evaluations += 1
+        elif phase == "batch_scores":
+            STATS.evaluations += len(result)
+        elif phase == "clear_lines":
+            STATS.lines_cleared += result[0]
+        return result
+
+    return wrapper
+
+
+def enable(hooks: dict[str, Callable[[], ContextManager]] | None = None):
+    """
+    Start counting and timing every phase, running the phases named in hooks
+    inside their hook.
+    """
+    disable()
+    hooks = hooks or {}
+    for phase, methods in PHASES.items():
+        for cls, name in methods:
+            method = cls.__dict__[name]
+            originals[(cls, name)] = method
+            setattr(cls, name, instrument(phase, method, hooks.get(phase)))
+
+
+def disable():
+    """
+    Put back the uninstrumented methods. The totals in STATS are kept.
+    """
+    for (cls, name), method in originals.items():
+        setattr(cls, name, method)
+    originals.clear()
+
+
+def profiler_hook(profiler) -> Callable[[], ContextManager]:
+    """
+    A hook running calls under a profiler with enable() and disable(), such as
+    cProfile.Profile, or start() and stop(), as sampling profilers tend to
+    have. Nested calls leave the profiler running until the outermost returns.
+    """
+    start = getattr(profiler, "enable", None) or profiler.start
+    stop = getattr(profiler, "disable", None) or profiler.stop
+    depth = 0
+
+    @contextmanager
+    def hook():
+        nonlocal depth
+        if not depth:
+            start()
+        depth += 1
+        try:
+            yield
+        finally:
+            depth -= 1
+            if not depth:
+                stop()
+
+    return hook
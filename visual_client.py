@@ -1,28 +1,44 @@
 from client import TetrisClient
 import pygame as pg
-from main import Board, PieceDisplay, ScoreDisplay
+from board import Board
+from render import BoardSprite, PieceDisplay, ScoreDisplay
 
 
 class VisualTetrisClient(TetrisClient):
+    def __init__(self, board, *args, **kwargs):
+        super().__init__(board, *args, **kwargs)
+        self.sprite = BoardSprite(board)
+
+    def update(self, tick: bool = False):
+        self.sprite.update(tick=tick)
+
     def draw(self, surf: pg.surface.Surface):
-        pg.sprite.GroupSingle(self.board).draw(surf)
+        pg.sprite.GroupSingle(self.sprite).draw(surf)
 
 
 if __name__ == "__main__":
+    import sys
+
+    from replay import Recorder
+
     pg.init()
     win = pg.display.set_mode((700, 700), pg.RESIZABLE)
     clock = pg.time.Clock()
     client = VisualTetrisClient(board=Board())
+    # python visual_client.py game.replay records the game
+    recorder = Recorder(client.board, sys.argv[1]) if len(sys.argv) > 1 else None
     elements = pg.sprite.Group(
-        PieceDisplay(client.board),
-        PieceDisplay(client.board, type="saved"),
-        ScoreDisplay(client.board),
+        PieceDisplay(client.sprite),
+        PieceDisplay(client.sprite, type="saved"),
+        ScoreDisplay(client.sprite),
     )
     # client.find_permutations(client.board)
     while True:
         # clock.tick(4)
         for event in pg.event.get():
             if event.type == pg.QUIT:
+                if recorder:
+                    recorder.close()
                 pg.quit()
                 quit()
 
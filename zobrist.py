@@ -0,0 +1,20 @@
+"""
+Zobrist keys for hashing the locked cells of a board.
+
+A board's hash is the XOR of the keys of its filled cells, so locking a
+piece only XORs in its own cells.
+"""
+
+import random
+from functools import cache
+
+
+@cache
+def zobrist_table(height: int = 20, width: int = 10) -> tuple[tuple[int, ...], ...]:
+    """
+    A fixed random 64 bit key for every cell, indexed as table[row][col].
+    """
+    rng = random.Random(height * 1000 + width)
+    return tuple(
+        tuple(rng.getrandbits(64) for _ in range(width)) for _ in range(height)
+    )